@@ -0,0 +1,276 @@
+"""
+In-memory And-Inverter Graph
+"""
+
+import logging
+from array import array
+
+CONST, INPUT, LATCH, AND = 0, 1, 2, 3
+
+log = logging.getLogger(__name__)
+
+
+class AIG:
+    """
+    And-Inverter Graph over AIGER style literals (2 * var, +1 for negation). Variable 0 is the
+    constant false. Every variable has a kind, and gates keep their two fan-in literals in flat
+    arrays indexed by variable. Gates are only created through add_and, which folds constants,
+    trivial and complementary fan-ins and structurally hashes the fan-in pair, so a gate is always
+    numbered after its fan-ins and the variable order is a topological order.
+    """
+
+    def __init__(self):
+        self.kind = bytearray([CONST])
+        self.fanin0 = array("I", [0])
+        self.fanin1 = array("I", [0])
+        # variable of the AIGER file each variable comes from (0 for gates created on the way)
+        self.origin = array("I", [0])
+        self.inputs = array("I")
+        self.latches = array("I")
+        self.nexts = array("I")
+        # 0, 1 or the latch literal itself when the latch is uninitialized
+        self.inits = array("I")
+        # an output being true violates the property
+        self.outputs = array("I")
+        # invariant constraints, must hold in every step of a trace
+        self.constraints = array("I")
+        self.names = dict()  # variable -> symbol
+        self.strash = dict()
+        # AIGER variables of the inputs and latches of the file the graph was read from, in file
+        # order, and the initial values of those latches, so that traces can be given over the
+        # file after reductions dropped inputs or latches (empty for graphs built in memory)
+        self.file_inputs = array("I")
+        self.file_latches = array("I")
+        self.file_inits = array("I")
+
+    @property
+    def num_vars(self):
+        return len(self.kind)
+
+    @property
+    def num_ands(self):
+        return len(self.strash)
+
+    def _new_var(self, kind, f0=0, f1=0, origin=0):
+        self.kind.append(kind)
+        self.fanin0.append(f0)
+        self.fanin1.append(f1)
+        self.origin.append(origin)
+        return len(self.kind) - 1
+
+    def add_input(self, name=None, origin=0):
+        lit = 2 * self._new_var(INPUT, origin=origin)
+        self.inputs.append(lit)
+        if name is not None:
+            self.names[lit >> 1] = name
+        return lit
+
+    def add_latch(self, init=0, name=None, origin=0):
+        """
+        :param init: 0, 1 or None for an uninitialized latch
+        """
+        lit = 2 * self._new_var(LATCH, origin=origin)
+        self.latches.append(lit)
+        self.nexts.append(0)
+        self.inits.append(lit if init is None else init)
+        if name is not None:
+            self.names[lit >> 1] = name
+        return lit
+
+    def set_next(self, idx: int, lit: int):
+        self.nexts[idx] = lit
+
+    def add_and(self, a: int, b: int):
+        if a < b:
+            a, b = b, a
+        # constant and trivial cases: x & 0, x & !x -> 0, x & 1, x & x -> x
+        if b == 0 or a == b ^ 1:
+            return 0
+        if b == 1 or a == b:
+            return a
+        key = (a, b)
+        lit = self.strash.get(key)
+        if lit is None:
+            lit = 2 * self._new_var(AND, a, b)
+            self.strash[key] = lit
+        return lit
+
+    def add_or(self, a: int, b: int):
+        return self.add_and(a ^ 1, b ^ 1) ^ 1
+
+    def add_xor(self, a: int, b: int):
+        return self.add_or(self.add_and(a, b ^ 1), self.add_and(a ^ 1, b))
+
+    def add_mux(self, s: int, t: int, e: int):
+        # s ? t : e
+        return self.add_or(self.add_and(s, t), self.add_and(s ^ 1, e))
+
+    @classmethod
+    def from_tables(cls, tables):
+        """
+        Build the graph from the tables of model.read_in, AIGER variables are renumbered so that
+        inputs come first, then latches, then the gates that survive hashing and folding.
+        """
+        aig = cls()
+        lit_map = array("I", [0]) * (tables.header.max_var_index + 1)
+
+        def m(l):
+            return lit_map[l >> 1] ^ (l & 1)
+
+        aig.file_inputs.extend(l >> 1 for l in tables.inputs)
+        aig.file_latches.extend(l >> 1 for l in tables.latches)
+        aig.file_inits.extend(tables.inits)
+        for idx, it in enumerate(tables.inputs):
+            lit_map[it >> 1] = aig.add_input(tables.symbols["i"].get(idx), origin=it >> 1)
+        for idx, it in enumerate(tables.latches):
+            init = tables.inits[idx]
+            lit_map[it >> 1] = aig.add_latch(init if init < 2 else None, tables.symbols["l"].get(idx), origin=it >> 1)
+        lhs, rhs0, rhs1 = tables.and_lhs, tables.and_rhs0, tables.and_rhs1
+        defined = bytearray(len(lit_map))
+        defined[0] = 1
+        for l in list(tables.inputs) + list(tables.latches) + list(lhs):
+            defined[l >> 1] = 1
+        for l in list(rhs0) + list(rhs1) + list(tables.nexts) + list(tables.outputs) + list(tables.bads):
+            if not defined[l >> 1]:
+                log.error("Error in AND definition, in node %d", l & ~1)
+                exit(1)
+        for i in _and_order(tables):
+            lit_map[lhs[i] >> 1] = aig.add_and(m(rhs0[i]), m(rhs1[i]))
+        for idx, nxt in enumerate(tables.nexts):
+            aig.set_next(idx, m(nxt))
+        # bad state properties are checked the same way as outputs
+        aig.outputs.extend(m(l) for l in tables.outputs)
+        aig.outputs.extend(m(l) for l in tables.bads)
+        aig.constraints.extend(m(l) for l in tables.invariants)
+        return aig
+
+    def coi(self, outputs=None):
+        """
+        Copy of the graph restricted to the cone of influence of the given outputs (all outputs by
+        default) and of the constraints, latches are followed through their next state functions.
+        """
+        if outputs is None:
+            outputs = list(self.outputs)
+        latch_pos = {l >> 1: i for i, l in enumerate(self.latches)}
+        keep = bytearray(self.num_vars)
+        stack = [l >> 1 for l in outputs] + [l >> 1 for l in self.constraints]
+        while stack:
+            v = stack.pop()
+            if keep[v]:
+                continue
+            keep[v] = 1
+            k = self.kind[v]
+            if k == AND:
+                stack.append(self.fanin0[v] >> 1)
+                stack.append(self.fanin1[v] >> 1)
+            elif k == LATCH:
+                stack.append(self.nexts[latch_pos[v]] >> 1)
+        return self._copy(keep, outputs)
+
+    def _copy(self, keep, outputs):
+        res = AIG()
+        lit_map = array("I", [0]) * self.num_vars
+
+        def m(l):
+            return lit_map[l >> 1] ^ (l & 1)
+
+        for l in self.inputs:
+            v = l >> 1
+            if keep[v]:
+                lit_map[v] = res.add_input(self.names.get(v), origin=self.origin[v])
+        kept_latches = []
+        for idx, l in enumerate(self.latches):
+            v = l >> 1
+            if keep[v]:
+                init = self.inits[idx]
+                lit_map[v] = res.add_latch(init if init < 2 else None, self.names.get(v), origin=self.origin[v])
+                kept_latches.append(idx)
+        kind, fanin0, fanin1 = self.kind, self.fanin0, self.fanin1
+        for v in range(1, self.num_vars):
+            if keep[v] and kind[v] == AND:
+                lit_map[v] = res.add_and(m(fanin0[v]), m(fanin1[v]))
+        for new_idx, idx in enumerate(kept_latches):
+            res.set_next(new_idx, m(self.nexts[idx]))
+        res.outputs.extend(m(l) for l in outputs)
+        res.constraints.extend(m(l) for l in self.constraints)
+        res.file_inputs, res.file_latches, res.file_inits = self.file_inputs, self.file_latches, self.file_inits
+        return res
+
+    def merge(self, repl):
+        """
+        Copy of the graph where variable v is replaced by the literal repl[v] (of a variable
+        numbered before v, or the constant), latches replaced that way are dropped. The copy still
+        holds the logic that lost its fan-outs, coi() removes it.
+        """
+        res = AIG()
+        lit_map = array("I", [0]) * self.num_vars
+
+        def m(l):
+            return lit_map[l >> 1] ^ (l & 1)
+
+        for l in self.inputs:
+            v = l >> 1
+            lit_map[v] = res.add_input(self.names.get(v), origin=self.origin[v])
+        kept_latches = []
+        for idx, l in enumerate(self.latches):
+            v = l >> 1
+            if v in repl:
+                lit_map[v] = m(repl[v])
+                continue
+            init = self.inits[idx]
+            lit_map[v] = res.add_latch(init if init < 2 else None, self.names.get(v), origin=self.origin[v])
+            kept_latches.append(idx)
+        kind, fanin0, fanin1 = self.kind, self.fanin0, self.fanin1
+        for v in range(1, self.num_vars):
+            if kind[v] == AND:
+                lit_map[v] = m(repl[v]) if v in repl else res.add_and(m(fanin0[v]), m(fanin1[v]))
+        for new_idx, idx in enumerate(kept_latches):
+            res.set_next(new_idx, m(self.nexts[idx]))
+        res.outputs.extend(m(l) for l in self.outputs)
+        res.constraints.extend(m(l) for l in self.constraints)
+        res.file_inputs, res.file_latches, res.file_inits = self.file_inputs, self.file_latches, self.file_inits
+        return res
+
+    def __repr__(self):
+        return (
+            f"AIG(inputs={len(self.inputs)}, latches={len(self.latches)}, ands={self.num_ands}, "
+            f"outputs={len(self.outputs)}, constraints={len(self.constraints)})"
+        )
+
+
+def _and_order(tables):
+    """
+    Indices of the and gates of AIGER tables in an order where every gate comes after its
+    fan-ins. Binary files are sorted by definition, ASCII files usually are, so the common case is
+    a single scan.
+    """
+    n = len(tables.and_lhs)
+    pos_of = {tables.and_lhs[i] >> 1: i for i in range(n)}
+    if all(
+        pos_of.get(tables.and_rhs0[i] >> 1, -1) < i and pos_of.get(tables.and_rhs1[i] >> 1, -1) < i for i in range(n)
+    ):
+        return range(n)
+    order, state = [], [0] * n  # 0 unvisited, 1 on stack, 2 done
+    for root in range(n):
+        stack = [root]
+        while stack:
+            i = stack[-1]
+            if state[i] == 2:
+                stack.pop()
+                continue
+            state[i] = 1
+            pending = [
+                pos_of[r >> 1]
+                for r in (tables.and_rhs0[i], tables.and_rhs1[i])
+                if r >> 1 in pos_of and state[pos_of[r >> 1]] != 2
+            ]
+            if any(state[j] == 1 for j in pending):
+                log.error("Error in AND definition, cycle through node %d", tables.and_lhs[i])
+                exit(1)
+            if pending:
+                stack.extend(pending)
+            else:
+                state[i] = 2
+                order.append(i)
+                stack.pop()
+    return order
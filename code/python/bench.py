@@ -0,0 +1,248 @@
+"""
+Batch benchmark harness: runs engines over directories of AIGER files, every instance in its own
+process with a time and memory limit, and writes the results in the format of
+dataset/aig_benchmark/hwmcc07/hwmcc07results.csv (status;time;space per tool) so they can be
+put next to the 2007 competition.
+
+python bench.py -dir ../../dataset/aig_benchmark/hwmcc07/tip -engines pdr,kind -timeout 60 -jobs 4
+    -ref ../../dataset/aig_benchmark/hwmcc07/hwmcc07results.csv
+"""
+
+import argparse
+import glob
+import logging
+import os
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import path as osp
+
+root = osp.abspath(osp.join(__file__, "../../../"))
+sys.path.append(root)
+from portfolio import IC3REF
+from solver import SOLVERS
+
+BENCH_ENGINES = ("pdr", "kind", "pkind", "itp", "bmc", "portfolio", "ic3ref")
+# status values of hwmcc07results.csv, SAT means the property fails and UNSAT that it holds,
+# signal is any other exit (crash, out of memory). unknown is a bmc run that reached its bound.
+SOLVED = ("SAT", "UNSAT")
+
+
+def instance_name(filename):
+    return osp.splitext(osp.basename(filename))[0]
+
+
+def find_instances(dirs):
+    files = []
+    for d in dirs:
+        if osp.isfile(d):
+            files.append(d)
+            continue
+        for ext in ("aig", "aag"):
+            files += glob.glob(osp.join(d, "**", "*." + ext), recursive=True)
+    return sorted(set(files), key=instance_name)
+
+
+def check(filename, engine, solver, k, sim_budget, do_sweep, stats_dir=None, simple_path=False):
+    """
+    child side: run one engine on one file and print its verdict on the last line, the statistics
+    of the python engines go to stats_dir/<instance>.<engine>.json
+    """
+    from model import Model
+    from bmc import BMC
+    from itp import ITP
+    from pdr import PDR
+    from portfolio import run_portfolio
+    from stats import Stats
+    from sweep import sweep
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+    # written every second as well, see stats.py
+    stats = Stats(osp.join(stats_dir, f"{instance_name(filename)}.{engine}.json") if stats_dir else None, 1.0)
+    aig = Model().parse(filename)
+    if do_sweep:
+        aig = sweep(aig, solver)
+    if engine == "pdr":
+        res = PDR(aig, solver, filename, sim_budget=sim_budget, stats=stats).run()
+    elif engine == "kind":
+        res = BMC(aig, solver, filename, sim_budget, stats, simple_path).run(k_ind=True)
+    elif engine == "pkind":
+        res = BMC(aig, solver, filename, sim_budget, stats, simple_path).run(k_ind=True, parallel=True)
+    elif engine == "itp":
+        res = ITP(aig, solver, filename, sim_budget, stats).run()
+    elif engine == "bmc":
+        res = BMC(aig, solver, filename, sim_budget, stats).run(k_ind=False, k=k)
+    else:
+        name, proven = run_portfolio(aig, filename, solver=solver, k=k)
+        res = None if name is None else (proven,)
+    status = "unknown" if res is None else "UNSAT" if res[0] else "SAT"
+    print(f"RESULT {status}", flush=True)
+
+
+def run_instance(filename, engine, args):
+    """
+    :return: (status, wall clock seconds, peak resident set size of the instance process in MB)
+    """
+    if engine == "ic3ref":
+        cmd = [IC3REF]
+    else:
+        cmd = [sys.executable, osp.abspath(__file__), "-check", filename, "-engines", engine]
+        cmd += ["-solver", args.solver, "-k", str(args.k), "-sim", str(args.sim)] + (["-sweep"] if args.sweep else [])
+        cmd += ["-stats", args.stats] if args.stats else []
+        cmd += ["-simple_path"] if args.simple_path else []
+    limit = args.memory * 1024 * 1024
+
+    def set_limits():
+        if args.memory > 0:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    with tempfile.TemporaryFile() as out, open(filename, "rb") as fin:
+        start = time.time()
+        # a session of its own, so the portfolio processes are killed along with it
+        p = subprocess.Popen(
+            cmd, stdin=fin, stdout=out, stderr=subprocess.DEVNULL, preexec_fn=set_limits, start_new_session=True
+        )
+        timed_out = False
+        while True:
+            pid, status, usage = os.wait4(p.pid, os.WNOHANG)
+            if pid != 0:
+                break
+            if time.time() - start > args.timeout:
+                timed_out = True
+                os.killpg(p.pid, signal.SIGKILL)
+                pid, status, usage = os.wait4(p.pid, 0)
+                break
+            time.sleep(0.05)
+        elapsed = time.time() - start
+        p.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        lines = out.read().decode(errors="replace").split()
+    space = usage.ru_maxrss / 1024
+    if timed_out:
+        return "timeout", elapsed, space
+    if engine == "ic3ref":
+        # IC3ref prints 0 for a safe and 1 for an unsafe model
+        if lines and lines[-1] in ("0", "1"):
+            return ("UNSAT" if lines[-1] == "0" else "SAT"), elapsed, space
+    elif len(lines) >= 2 and lines[-2] == "RESULT" and p.returncode == 0:
+        return lines[-1], elapsed, space
+    return "signal", elapsed, space
+
+
+def read_results(filename):
+    """
+    Read a results CSV: a row of tool names (each one over its status;time;space columns), a row
+    of column names, a SOLVED summary row and one row per instance.
+
+    :return: list of tool names, {instance: {tool: (status, time, space)}}
+    """
+    with open(filename) as fp:
+        rows = [line.rstrip("\r\n").split(";") for line in fp]
+    tools = rows[0][1::3]
+    res = dict()
+    for r in rows[2:]:
+        if not r[0] or r[0] == "SOLVED":
+            continue
+        res[r[0]] = {t: (r[1 + 3 * i], float(r[2 + 3 * i]), float(r[3 + 3 * i])) for i, t in enumerate(tools)}
+    return tools, res
+
+
+def write_results(filename, tools, results):
+    lines = [";" + ";".join(t for t in tools for _ in range(3)), ";" + ";".join("status;time;space" for _ in tools)]
+    summary = ["SOLVED"]
+    for t in tools:
+        solved = [results[n][t] for n in results if results[n][t][0] in SOLVED]
+        time_sum, space_max = sum(s[1] for s in solved), max((s[2] for s in solved), default=0)
+        summary += [str(len(solved)), f"{time_sum:.2f}", f"{space_max:.1f}"]
+    lines.append(";".join(summary))
+    for n in sorted(results):
+        lines.append(";".join([n] + [f"{s};{t:.2f};{m:.1f}" for s, t, m in (results[n][t] for t in tools)]))
+    with open(filename, "w") as fp:
+        fp.write("\n".join(lines) + "\n")
+
+
+def summary(tools, results, ref_tools, ref, timeout):
+    """
+    Solved instances, time spent on them and peak memory per tool, the competition tools are
+    counted on the same instances and only when they answered within the same time limit.
+    """
+    names = sorted(results)
+    print(f"{'tool':<20}{'solved':>8}{'SAT':>6}{'UNSAT':>7}{'time':>10}{'space':>9}")
+    rows = [(t, [results[n][t] for n in names]) for t in tools]
+    rows += [(t, [ref[n][t] for n in names if n in ref]) for t in ref_tools]
+    for t, res in rows:
+        solved = [r for r in res if r[0] in SOLVED and r[1] <= timeout]
+        n_sat = sum(r[0] == "SAT" for r in solved)
+        print(
+            f"{t:<20}{len(solved):>8}{n_sat:>6}{len(solved) - n_sat:>7}"
+            f"{sum(r[1] for r in solved):>10.2f}{max((r[2] for r in solved), default=0):>9.1f}"
+        )
+    # a definite answer that contradicts a competition tool is a bug on one side
+    for n in names:
+        for t in tools:
+            status = results[n][t][0]
+            if status not in SOLVED or n not in ref:
+                continue
+            wrong = [rt for rt in ref_tools if ref[n][rt][0] in SOLVED and ref[n][rt][0] != status]
+            if wrong:
+                print(f"MISMATCH {n}: {t} says {status}, {', '.join(wrong)} disagree")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run model checking engines over benchmark directories")
+    parser.add_argument("-dir", type=str, nargs="*", help="directories (searched recursively) or files", default=[])
+    parser.add_argument("-engines", type=str, help=f"comma separated, out of {','.join(BENCH_ENGINES)}", default="pdr")
+    parser.add_argument(
+        "-solver", type=str, help="SAT backend of the python engines", default="minisat22", choices=SOLVERS
+    )
+    parser.add_argument("-k", type=int, help="bound of the bmc engine", default=1000)
+    parser.add_argument("-sim", type=float, help="seconds of random simulation before bmc, pdr and itp", default=0.5)
+    parser.add_argument("-sweep", action="store_true", help="merge equivalent latches and gates before the engines")
+    parser.add_argument("-simple_path", action="store_true", help="complete k-induction on paths without loops")
+    parser.add_argument("-timeout", type=float, help="seconds per instance", default=60)
+    parser.add_argument("-memory", type=int, help="address space limit per instance in MB, 0 for none", default=4096)
+    parser.add_argument("-jobs", type=int, help="instances run in parallel", default=os.cpu_count())
+    parser.add_argument("-out", type=str, help="results CSV to write", default="bench_results.csv")
+    parser.add_argument("-ref", type=str, help="results CSV to compare with, e.g. hwmcc07results.csv", default=None)
+    parser.add_argument("-stats", type=str, help="directory of the JSON statistics of every run", default=None)
+    parser.add_argument("-check", type=str, help=argparse.SUPPRESS, default=None)
+    args = parser.parse_args()
+
+    if args.check is not None:
+        check(args.check, args.engines, args.solver, args.k, args.sim, args.sweep, args.stats, args.simple_path)
+        return
+    if args.stats:
+        os.makedirs(args.stats, exist_ok=True)
+        args.stats = osp.abspath(args.stats)
+
+    engines = args.engines.split(",")
+    for e in engines:
+        if e not in BENCH_ENGINES:
+            print(f"Unknown engine {e}, choose out of {', '.join(BENCH_ENGINES)}")
+            exit(1)
+    files = find_instances(args.dir)
+    print(f"{len(files)} instances, engines {', '.join(engines)}, {args.jobs} jobs")
+
+    results = {instance_name(f): dict() for f in files}
+
+    def job(task):
+        f, e = task
+        res = run_instance(f, e, args)
+        results[instance_name(f)][e] = res
+        print(f"{instance_name(f):<40}{e:<12}{res[0]:<9}{res[1]:8.2f}s{res[2]:9.1f}MB", flush=True)
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        list(pool.map(job, [(f, e) for f in files for e in engines]))
+
+    write_results(args.out, engines, results)
+    print(f"results written to {args.out}")
+    ref_tools, ref = read_results(args.ref) if args.ref else ([], dict())
+    summary(engines, results, ref_tools, ref, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,99 +1,348 @@
-from z3 import Solver, Bool, substitute, Not, sat, unsat, simplify
-import copy
+import logging
+import multiprocessing as mp
+import queue
 
+from aig import AIG
+from cnf import AIGCNF
+from sim import random_cex
+from solver import make_solver
+from stats import Stats
+from witness import Counterexample
 
-class BMC:
-    def __init__(self, inputs, primed_inputs, vars, primed_vars, init, trans, post, filename):
+log = logging.getLogger(__name__)
+
+
+class Unroller:
+    """
+    One incremental unrolling of the transition relation in its own solver. Frame k of the
+    unrolling is a frame of the encoder, the frame template shifted by its offset, added to the
+    solver when the unrolling grows, frames already in the solver are never copied or rebuilt.
+
+    Frames of the encoder are taken in order, for the unrolling or as a pool of variables for the
+    constraints that keep two states of a path apart (simple path checks), so frame k of the
+    unrolling is frame slots[k] of the encoder.
+    """
+
+    def __init__(self, enc: AIGCNF, solver="minisat22", init=True):
         """
-        :param inputs:
-        :param vars: Boolean Variables
-        :param primed_vars: The Post Condition Variable
-        :param init: The initial State
-        :param trans: Transition Function
-        :param post: The Safety Property
+        :param enc: encoder of the system, shared by every unrolling of it
+        :param init: constrain frame 0 to the initial states
         """
-        self.vars = vars + inputs
-        self.primed_vars = primed_vars + primed_inputs
-        self.init = init
-        self.trans = trans
-        self.post = post
-        self.filename = filename
-        self.frames = list()
-        # because bmc unrolls every single iteration, the variables are increasing,
-        # therefore, we dont need to create lMap or primeMap
-        self.vardict = dict()
-
-    def vardef(self, n: str):
-        if n in self.vardict:
-            return self.vardict[n]
-        v = Bool(n)
-        self.vardict[n] = v
-        return v
-
-    def setup(self, induction=False):
-        self.slv = Solver()
-        initmap = [(self.vars[i], self.vardef(str(self.vars[i]) + "_0")) for i in range(len(self.vars))]
-        if not induction:
-            self.slv.add(substitute(self.init.cube(), initmap))
+        self.enc = enc
+        self.slv = make_solver(solver)
         self.cnt = 0
+        self.slots = [0]
+        self.free_slot = 1
+        self.pool = []  # variables of a pool frame not used yet
+        self.distinct = set()  # frame pairs (i, j) constrained to differ in some latch
+        self.invariants = []  # clauses of AIG literals asserted in every frame
+        enc.add_frame(self.slv, 0)
+        self.add_constraints(0)
+        if init:
+            self.slv.add_clauses(enc.init_clauses())
 
-    def get_map(self, idx):
-        curr_map = [(self.vars[i], self.vardef(str(self.vars[i]) + "_" + str(idx))) for i in range(len(self.vars))]
-        next_map = [
-            (self.primed_vars[i], self.vardef(str(self.vars[i]) + "_" + str(idx + 1))) for i in range(len(self.vars))
-        ]
-        return curr_map + next_map
+    def add_constraints(self, slot):
+        for c in self.enc.constraint_lits(slot):
+            self.slv.add_clause([c])
 
     def unroll(self):
-        self.slv.add(substitute(simplify(self.trans.cube()), self.get_map(self.cnt)))
+        slot = self.free_slot
+        self.free_slot += 1
+        self.enc.add_trans(self.slv, self.slots[-1], slot)
+        self.slots.append(slot)
         self.cnt += 1
+        self.enc.add_frame(self.slv, slot)
+        self.add_constraints(slot)
+        lit = self.enc.lit
+        for c in self.invariants:
+            self.slv.add_clause([lit(l, slot) for l in c])
+
+    def add_invariant(self, clause):
+        """assert the clause (of AIG literals) in every frame, those to come included"""
+        self.invariants.append(clause)
+        lit = self.enc.lit
+        for slot in self.slots:
+            self.slv.add_clause([lit(l, slot) for l in clause])
+
+    def bad(self, idx=None):
+        """bad literal of frame `idx`, the last one by default"""
+        return self.enc.bad_lit(self.slots[self.cnt if idx is None else idx])
+
+    def new_var(self):
+        if not self.pool:
+            # a frame of the encoder the unrolling does not use, its variables are free
+            first = self.enc.var(0, self.free_slot)
+            self.free_slot += 1
+            self.pool = list(range(first + self.enc.stride - 1, first - 1, -1))
+        return self.pool.pop()
+
+    def add_distinct(self, i, j):
+        """constrain frames i and j to differ in some latch"""
+        si, sj, lit = self.slots[i], self.slots[j], self.enc.lit
+        diff = []
+        for l in self.enc.aig.latches:
+            d = self.new_var()
+            a, b = lit(l, si), lit(l, sj)
+            # d -> a != b
+            self.slv.add_clause([-d, a, b])
+            self.slv.add_clause([-d, -a, -b])
+            diff.append(d)
+        self.slv.add_clause(diff)
+        self.distinct.add((i, j))
+
+    def equal_states(self):
+        """pairs of frames of the model of the last satisfiable check that are in the same state"""
+        value, lit, latches = self.slv.value, self.enc.lit, self.enc.aig.latches
+        first = dict()
+        pairs = []
+        for k in range(self.cnt + 1):
+            slot = self.slots[k]
+            state = tuple(value(lit(l, slot)) for l in latches)
+            if state in first:
+                pairs.append((first[state], k))
+            first[state] = k
+        return pairs
+
+    def check_simple(self, assumptions=()):
+        """
+        check on simple paths only: as long as a model visits a state twice, the frames where it
+        does are constrained to differ and the check is repeated, so only the pairs of frames the
+        solver actually puts in the same state ever get a constraint
+        """
+        while self.slv.solve(assumptions):
+            pairs = self.equal_states()
+            if not pairs:
+                return True
+            for i, j in pairs:
+                self.add_distinct(i, j)
+        return False
+
+    def add(self, clause):
+        self.slv.add_clause(clause)
+
+    def check(self, assumptions=()):
+        return self.slv.solve(assumptions)
+
+    def trace(self):
+        """the path through frames 0..cnt of the model of the last satisfiable check"""
+        aig, lit, value = self.enc.aig, self.enc.lit, self.slv.value
+        init = [int(value(lit(l))) for l in aig.latches]
+        inputs = [[int(value(lit(l, s))) for l in aig.inputs] for s in self.slots]
+        return Counterexample(init, inputs)
+
 
-    def add(self, constraint):
-        idx = self.cnt
-        var_map = self.get_map(idx)
-        self.slv.add(substitute(constraint, var_map))
+class BMC:
+    def __init__(
+        self,
+        aig: AIG,
+        solver="minisat22",
+        filename="",
+        sim_budget=0.5,
+        stats: Stats = None,
+        simple_path=False,
+        lemma_in=None,
+    ):
+        """
+        :param aig: the system, its outputs are the bad states (see aig.AIG)
+        :param solver: SAT backend, see solver.SOLVERS
+        :param filename: the file the system comes from
+        :param sim_budget: budget of sim.random_cex
+        :param stats: see stats.py
+        :param simple_path: the step case of k-induction only considers paths that visit a state
+            once, which makes it complete on finite systems, see Unroller.check_simple
+        :param lemma_in: queue of invariants (clauses of latch literals, e.g. from PDR.lemma_out)
+            that strengthen the step case of k-induction as they arrive
+        """
+        self.aig = aig
+        self.solver = solver
+        self.filename = filename
+        self.sim_budget = sim_budget
+        self.simple_path = simple_path
+        self.lemma_in = lemma_in
+        # frame k of the unrolling is the frame template shifted by k * stride, so there is no
+        # need to create lMap or primeMap
+        self.enc = AIGCNF(aig)
+        self.stats = Stats() if stats is None else stats
+
+    def run(self, k_ind=True, k=None, parallel=False):
+        """
+        :param k: bound on the number of transitions, 1000 for k-induction and 10 for plain BMC
+            by default
+        :param parallel: k-induction with the base and the step case in two processes, see
+            run_parallel
+        :return: (False, counterexample), (True, []) when the property is k-inductive, None when
+            the bound is reached
+        """
+        if k is None:
+            k = 1000 if k_ind else 10
+        try:
+            if k_ind and parallel:
+                return self.run_parallel(k)
+            return self._run(k_ind, k)
+        finally:
+            self.stats.dump()
+
+    def run_parallel(self, k=1000):
+        """
+        k-induction with the base case and the step case unrolled by two forked workers, each one
+        advancing its own bound. The base worker reports every bound it has cleared and the step
+        worker the bound where the step case holds, the property is proven once the base case is
+        clear up to one transition below that bound. The step worker also reports the bounds where
+        the step case fails, so that every report carries the current statistics of its worker
+        (depth, conflicts, time in the checks), they are merged into the ones of this run.
+        """
+        stats = self.stats
+        with stats.timer("random_sim"):
+            cex = random_cex(self.aig, self.sim_budget)
+        if cex is not None:
+            return False, cex
+        ctx = mp.get_context("fork")
+        results = ctx.Queue()
+        procs = [ctx.Process(target=f, args=(self, k, results), daemon=True) for f in (_base_case, _step_case)]
+        for p in procs:
+            p.start()
+        base_depth, step_depth, step_done = -1, None, False
+        try:
+            while True:
+                try:
+                    msg, step, cex, snapshot = results.get(timeout=0.05)
+                except queue.Empty:
+                    # a worker that died without an answer (crash, out of memory) ends the run
+                    if any(p.exitcode not in (None, 0) for p in procs):
+                        log.warning("k-induction worker exited with code %s", [p.exitcode for p in procs])
+                        return None
+                    continue
+                stats.merge(snapshot)
+                if msg == "cex":
+                    if step == 0:
+                        log.info("Safty property Falsified: bad state is reachable from initial state!")
+                    else:
+                        log.info("Safty property Falsified: Found CEX after %d steps", step)
+                    return False, cex
+                if msg == "base":
+                    base_depth = step
+                    log.info("Base case clear after %d transitions", step)
+                elif msg == "step":
+                    step_depth = step
+                elif msg == "step_bound":
+                    step_done = True
+                stats.tick()
+                if step_depth is not None and base_depth >= step_depth - 1:
+                    log.info("Safty property Proven: get inductive invariant")
+                    return True, []
+                if base_depth == k and step_done:
+                    log.info("Invariant couldn't be proven inductive after %d transitions", k)
+                    return None
+        finally:
+            for p in procs:
+                p.kill()
+                p.join()
+
+    def step_check(self, kind: Unroller):
+        # a path of property states into bad, on simple paths only in the simple path mode
+        self.import_invariants(kind)
+        if self.simple_path:
+            return kind.check_simple([kind.bad()])
+        return kind.check([kind.bad()])
 
-    def check(self):
-        return self.slv.check()
+    def import_invariants(self, kind: Unroller):
+        # the invariants that arrived since the last step check, they restrict the step case to
+        # states that can be reachable
+        if self.lemma_in is None:
+            return
+        while True:
+            try:
+                clause = self.lemma_in.get_nowait()
+            except queue.Empty:
+                return
+            kind.add_invariant(clause)
+            self.stats.inc("lemmas_imported")
 
-    def run(self, k_ind=True, k=10):
+    def _run(self, k_ind, k):
+        stats = self.stats
+        with stats.timer("random_sim"):
+            cex = random_cex(self.aig, self.sim_budget)
+        if cex is not None:
+            return False, cex
         # BASE CASE
-        bmc_base = copy.deepcopy(self)
-        step = 0
+        bmc_base = Unroller(self.enc, self.solver)  # verify init & T -> P is valid
+        stats.collect("base_conflicts", bmc_base.slv.conflicts)
         if k_ind:
-            bmc_kind = copy.deepcopy(bmc_base)
-            bmc_kind.setup(induction=True)  # to verify P & T -> P'
-            bmc_kind.add(substitute(bmc_kind.post.cube(), bmc_kind.get_map(0)))  # add p
-            k = 1000
-        bmc_base.setup()  # verify init & T -> P is valid
-        bmc_base.slv.push()
-        bmc_base.add(substitute(Not(bmc_base.post.cube()), bmc_base.get_map(0)))
-        if bmc_base.check() == sat:
-            print(f"Safty property Falsified: bad state is reachable from initial state!")
-            # TODO: Add your trace_print function call here if needed
-            return False, []
-        bmc_base.slv.pop()
-        
+            bmc_kind = Unroller(self.enc, self.solver, init=False)  # to verify P & T -> P'
+            bmc_kind.add([-bmc_kind.bad()])  # add p
+            stats.collect("step_conflicts", bmc_kind.slv.conflicts)
+            stats.collect("distinct_pairs", lambda: len(bmc_kind.distinct))
+        with stats.timer("base_case"):
+            res = bmc_base.check([bmc_base.bad()])
+        if res:
+            log.info("Safty property Falsified: bad state is reachable from initial state!")
+            return False, bmc_base.trace()
+        # no path reaches bad in fewer steps, later checks may assume it
+        bmc_base.add([-bmc_base.bad()])
+
         # INDUCTION STEP
         for step in range(1, k + 1):
+            stats.gauge("depth", step)
+            stats.tick()
             if k_ind:
-                print(f"Checking for CEX after {step} transitions")
-                # unroll -> push -> check -> pop
-                bmc_kind.unroll()
-                bmc_kind.slv.push()
+                log.info("Checking for CEX after %d transitions", step)
+                # unroll -> check under the assumption Not(p) -> assert p
+                with stats.timer("unroll"):
+                    bmc_kind.unroll()
                 # check if p&T&T&...->p' is valid
-                bmc_kind.add(substitute(Not(bmc_kind.post.cube()), bmc_kind.get_map(bmc_kind.cnt)))
-                if bmc_kind.check() == unsat:
+                with stats.timer("step_case"):
+                    res = self.step_check(bmc_kind)
+                if not res:
                     # reached property invariant
-                    print(f"Safty property Proven: get inductive invariant")
+                    log.info("Safty property Proven: get inductive invariant")
                     return True, []
-                bmc_kind.slv.pop()
-                
-            bmc_base.unroll()
-            bmc_base.slv.push()
-            bmc_base.add(substitute(Not(bmc_base.post.cube()), bmc_base.get_map(bmc_base.cnt)))
-            if bmc_base.check() == sat:
-                print(f"Safty property Falsified: Found CEX after {step} steps")
-                return False, []
-            bmc_base.slv.pop()
-        print(f"Invariant couldn't be proven inductive after {k} transitions")
+                bmc_kind.add([-bmc_kind.bad()])
+
+            with stats.timer("unroll"):
+                bmc_base.unroll()
+            with stats.timer("base_case"):
+                res = bmc_base.check([bmc_base.bad()])
+            if res:
+                log.info("Safty property Falsified: Found CEX after %d steps", step)
+                return False, bmc_base.trace()
+            bmc_base.add([-bmc_base.bad()])
+        log.info("Invariant couldn't be proven inductive after %d transitions", k)
+
+
+def _base_case(bmc: BMC, k, results):
+    # worker of run_parallel: no path from the initial states reaches bad in 0, 1, ... k transitions,
+    # its statistics are kept apart from the forked ones of the parent and sent with every report
+    stats = Stats()
+    base = Unroller(bmc.enc, bmc.solver)
+    stats.collect("base_conflicts", base.slv.conflicts)
+    for step in range(k + 1):
+        stats.gauge("base_depth", step)
+        with stats.timer("base_case"):
+            if step:
+                base.unroll()
+            res = base.check([base.bad()])
+        if res:
+            results.put(("cex", step, base.trace(), stats.as_dict()))
+            return
+        base.add([-base.bad()])
+        results.put(("base", step, None, stats.as_dict()))
+
+
+def _step_case(bmc: BMC, k, results):
+    # worker of run_parallel: the first number of transitions after which P & T & ... -> P' holds
+    bmc.stats = stats = Stats()  # lemmas_imported of step_check
+    kind = Unroller(bmc.enc, bmc.solver, init=False)
+    kind.add([-kind.bad()])
+    stats.collect("step_conflicts", kind.slv.conflicts)
+    stats.collect("distinct_pairs", lambda: len(kind.distinct))
+    for step in range(1, k + 1):
+        stats.gauge("step_depth", step)
+        with stats.timer("step_case"):
+            kind.unroll()
+            res = bmc.step_check(kind)
+        if not res:
+            results.put(("step", step, None, stats.as_dict()))
+            return
+        kind.add([-kind.bad()])
+        results.put(("step_clear", step, None, stats.as_dict()))
+    results.put(("step_bound", k, None, stats.as_dict()))
@@ -0,0 +1,163 @@
+"""
+Inductive invariant certificates
+
+A proof of PDR is the inductive invariant it converged to, a conjunction of clauses over the
+latches. It is written as a DIMACS like file of AIGER latch literals of the model file, one clause
+per line terminated by 0, and checked without PDR by three conditions:
+
+    init & C => Inv,    Inv & C & T => Inv',    Inv & C => P
+
+(C the invariant constraints), posed as queries of one incremental solver. Certificates are cached
+by a hash of the model file, a cached certificate is checked again before it is trusted.
+
+python certificate.py model.aig model.cert
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sys
+from os import path as osp
+
+root = osp.abspath(osp.join(__file__, "../../../"))
+sys.path.append(root)
+from aig import AIG
+from cnf import AIGCNF
+from solver import SOLVERS, make_solver
+
+log = logging.getLogger(__name__)
+
+
+def clauses_from_lemmas(lemmas):
+    """the invariant of PDR lemmas (blocked cubes over latch literals) as clauses"""
+    return sorted({tuple(l ^ 1 for l in cube.lits) for cube in lemmas})
+
+
+def _latch_map(aig: AIG):
+    # graph latch variable -> AIGER variable of the file (the graph itself when it was built in memory)
+    if not aig.file_latches:
+        return {l >> 1: l >> 1 for l in aig.latches}
+    return {l >> 1: aig.origin[l >> 1] for l in aig.latches}
+
+
+def write_certificate(aig: AIG, clauses, fp, name=""):
+    var_map = _latch_map(aig)
+    lines = [f"c inductive invariant of {name}".rstrip(), f"p inv {len(clauses)}"]
+    for c in clauses:
+        lines.append(" ".join(str(2 * var_map[l >> 1] + (l & 1)) for l in c) + " 0")
+    fp.write("\n".join(lines) + "\n")
+
+
+def read_certificate(aig: AIG, fp):
+    """
+    :return: the clauses over latch literals of the graph, None when the file is malformed or
+        mentions a latch the graph does not have
+    """
+    graph_var = {f: v for v, f in _latch_map(aig).items()}
+    clauses = []
+    for line in fp:
+        line = line.split()
+        if not line or line[0] in ("c", "p"):
+            continue
+        if line[-1] != "0":
+            return None
+        c = []
+        for x in map(int, line[:-1]):
+            if x >> 1 not in graph_var:
+                log.warning("Certificate literal %d is not a latch of the model", x)
+                return None
+            c.append(2 * graph_var[x >> 1] + (x & 1))
+        clauses.append(tuple(c))
+    return clauses
+
+
+def check_certificate(aig: AIG, clauses, solver="minisat22"):
+    """
+    Check that the clauses are an inductive invariant that implies the property, a failed
+    condition is logged.
+
+    Frame 0 and the latches of frame 1 are encoded once. Every clause is checked against the
+    initial states, then the invariant is asserted in frame 0 and the property and the clauses
+    in frame 1 are checked under it, each query assuming the negation of what it asks about.
+    """
+    enc = AIGCNF(aig)
+    slv = make_solver(solver)
+    slv.add_clauses(enc.frame_template)
+    slv.add_clauses(enc.trans_template)
+    for c in enc.constraint_lits(0):
+        slv.add_clause([c])
+    cur, nxt = enc.lit_table(0), enc.lit_table(1)
+    init = [cur[l ^ (i ^ 1)] for l, i in zip(aig.latches, aig.inits) if i < 2]
+    try:
+        for c in clauses:
+            if slv.solve(init + [-cur[l] for l in c]):
+                log.warning("Certificate rejected: clause %s excludes an initial state", list(c))
+                return False
+        for c in clauses:
+            slv.add_clause([cur[l] for l in c])
+        if slv.solve([enc.bad_lit()]):
+            log.warning("Certificate rejected: the invariant does not imply the property")
+            return False
+        for c in clauses:
+            if slv.solve([-nxt[l] for l in c]):
+                log.warning("Certificate rejected: clause %s is not inductive", list(c))
+                return False
+    finally:
+        slv.delete()
+    return True
+
+
+class CertificateCache:
+    """certificates kept in a directory under the hash of the model file they belong to"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, filename):
+        with open(filename, "rb") as fp:
+            key = hashlib.sha256(fp.read()).hexdigest()
+        return osp.join(self.directory, key + ".cert")
+
+    def get(self, aig: AIG, filename, solver="minisat22"):
+        """:return: the clauses of a cached certificate of the model that passes the check, else None"""
+        p = self.path(filename)
+        if not osp.exists(p):
+            return None
+        with open(p) as fp:
+            clauses = read_certificate(aig, fp)
+        if clauses is None or not check_certificate(aig, clauses, solver):
+            return None
+        return clauses
+
+    def put(self, aig: AIG, filename, clauses):
+        p = self.path(filename)
+        # replaced atomically like the statistics files, see Stats.dump
+        with open(p + ".tmp", "w") as fp:
+            write_certificate(aig, clauses, fp, osp.basename(filename))
+        os.replace(p + ".tmp", p)
+
+
+def main():
+    from model import Model
+
+    parser = argparse.ArgumentParser(description="Check an inductive invariant certificate of an AIGER model")
+    parser.add_argument("model", type=str, help="aag or aig file")
+    parser.add_argument("certificate", type=str, help="clauses of AIGER latch literals, see certificate.py")
+    parser.add_argument("-solver", type=str, help="SAT backend", default="minisat22", choices=SOLVERS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+
+    aig = Model().parse(args.model)
+    with open(args.certificate) as fp:
+        clauses = read_certificate(aig, fp)
+    if clauses is not None and check_certificate(aig, clauses, args.solver):
+        print(f"Certificate valid: {len(clauses)} clauses, safty property Proven")
+        exit(0)
+    print("Certificate invalid")
+    exit(1)
+
+
+if __name__ == "__main__":
+    main()
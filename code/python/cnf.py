@@ -0,0 +1,167 @@
+"""
+Direct Tseitin encoding of an AIG into integer clauses
+"""
+
+from array import array
+from aig import AIG, AND
+
+
+class AIGCNF:
+    """
+    Tseitin encoding of an AIG into DIMACS clauses kept in flat integer arrays, every clause is
+    terminated by a 0 like in a DIMACS file.
+
+    The variable map is fixed: AIG variable v in time frame k is DIMACS variable
+    1 + v + k * stride, with stride = number of AIG variables, so latches, inputs and gates keep
+    their identity across frames and unrolling is an integer offset. The encoding of one frame
+    (constant plus three clauses per gate) and the link from one frame to the next (latch in frame
+    k + 1 equals its next state function in frame k) are built once as templates, any other frame
+    is the template shifted by its offset.
+    """
+
+    def __init__(self, aig: AIG):
+        self.aig = aig
+        # all outputs are checked at once, or gates merge them into one bad literal (added to the
+        # graph before the variable map is fixed)
+        bad = 0
+        for l in aig.outputs:
+            bad = aig.add_or(bad, l)
+        self.bad = bad
+        self.stride = aig.num_vars
+        self.frame_template = self._encode_frame()
+        self.trans_template = self._encode_trans()
+        # the same templates as (gate, fanin, fanin) and (latch', next) literal tuples, for adding
+        # a shifted frame straight to a solver
+        self.gate_lits = [
+            (self.var(v), self.lit(aig.fanin0[v]), self.lit(aig.fanin1[v]))
+            for v in range(1, aig.num_vars)
+            if aig.kind[v] == AND
+        ]
+        self.link_lits = [(self.lit(l, 1), self.lit(n)) for l, n in zip(aig.latches, aig.nexts)]
+        self.lit_tables = [None, None]
+
+    def var(self, v: int, frame=0):
+        return 1 + v + frame * self.stride
+
+    def lit(self, l: int, frame=0):
+        d = 1 + (l >> 1) + frame * self.stride
+        return -d if l & 1 else d
+
+    def lit_table(self, frame=0):
+        """
+        DIMACS literal of every AIG literal in template frame `frame` (0 or 1), indexed by the AIG
+        literal and built once, so moving a cube to the next frame (priming it) is a lookup per
+        literal. Tables of the other frames are not kept, a deep unrolling would hold one per
+        frame, their literals are computed by lit.
+        """
+        table = self.lit_tables[frame]
+        if table is None:
+            table = self.lit_tables[frame] = [self.lit(l, frame) for l in range(2 * self.stride)]
+        return table
+
+    def _encode_frame(self):
+        aig = self.aig
+        kind, fanin0, fanin1 = aig.kind, aig.fanin0, aig.fanin1
+        lit = self.lit
+        # the constant variable is false
+        cls = array("i", [-self.var(0), 0])
+        for v in range(1, aig.num_vars):
+            if kind[v] != AND:
+                continue
+            g, a, b = self.var(v), lit(fanin0[v]), lit(fanin1[v])
+            # g <-> a & b
+            cls.extend((-g, a, 0, -g, b, 0, g, -a, -b, 0))
+        return cls
+
+    def _encode_trans(self):
+        cls = array("i")
+        for l, nxt in zip(self.aig.latches, self.aig.nexts):
+            # latch' <-> next
+            p, n = self.lit(l, 1), self.lit(nxt)
+            cls.extend((-p, n, 0, p, -n, 0))
+        return cls
+
+    def shift(self, clauses: array, frame: int):
+        # move clauses over frame 0 (and 1) variables to frame `frame` (and frame + 1)
+        if frame == 0:
+            return array("i", clauses)
+        off = frame * self.stride
+        return array("i", [x + off if x > 0 else x - off if x < 0 else 0 for x in clauses])
+
+    def frame_clauses(self, frame=0):
+        """gate definitions of time frame `frame`"""
+        return self.shift(self.frame_template, frame)
+
+    def trans_clauses(self, frame=0):
+        """latches of frame `frame` + 1 take the next state values computed in frame `frame`"""
+        return self.shift(self.trans_template, frame)
+
+    def add_frame(self, slv, frame=0):
+        """
+        Add the gate definitions of time frame `frame` to the solver. The literals are shifted
+        while they are added, no clause array of the frame is built, which is what an incremental
+        unrolling spends its time on for big designs.
+        """
+        off = frame * self.stride
+        add = slv.add_clause
+        add([-self.var(0, frame)])
+        for g, a, b in self.gate_lits:
+            g += off
+            a = a + off if a > 0 else a - off
+            b = b + off if b > 0 else b - off
+            add([-g, a])
+            add([-g, b])
+            add([g, -a, -b])
+
+    def add_trans(self, slv, frame=0, next_frame=None):
+        """
+        add the link from time frame `frame` to `next_frame` (`frame` + 1 by default) to the
+        solver, see add_frame
+        """
+        off = frame * self.stride
+        # the latch literals of the link are in frame 1
+        next_off = off if next_frame is None else (next_frame - 1) * self.stride
+        add = slv.add_clause
+        for p, n in self.link_lits:
+            p = p + next_off if p > 0 else p - next_off
+            n = n + off if n > 0 else n - off
+            add([-p, n])
+            add([p, -n])
+
+    def init_clauses(self, frame=0):
+        cls = array("i")
+        for l, init in zip(self.aig.latches, self.aig.inits):
+            if init < 2:
+                cls.extend((self.lit(l ^ (init ^ 1), frame), 0))
+        return cls
+
+    def bad_lit(self, frame=0):
+        """literal that is true when some output is violated in time frame `frame`"""
+        return self.lit(self.bad, frame)
+
+    def constraint_lits(self, frame=0):
+        return [self.lit(l, frame) for l in self.aig.constraints]
+
+    def unroll(self, k: int):
+        """clauses of frames 0..k linked by k transitions, without the initial states"""
+        cls = array("i")
+        for i in range(k + 1):
+            cls.extend(self.frame_clauses(i))
+            if i < k:
+                cls.extend(self.trans_clauses(i))
+        return cls
+
+    def num_vars(self, k=0):
+        """number of DIMACS variables used by frames 0..k"""
+        return (k + 1) * self.stride
+
+
+def iter_clauses(flat: array):
+    """split a flat 0-terminated clause array into lists"""
+    clause = []
+    for x in flat:
+        if x == 0:
+            yield clause
+            clause = []
+        else:
+            clause.append(x)
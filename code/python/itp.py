@@ -0,0 +1,498 @@
+"""
+Interpolation based model checking (McMillan 2003)
+
+A bounded check is split into A, the states R of the current approximation and one transition,
+and B, the paths of k - 1 further transitions that reach a bad state from frame 1. When A & B is
+unsatisfiable, a Craig interpolant over the latches of frame 1 over-approximates the image of R
+and reaches no bad state within k steps. R grows by its interpolants until one adds nothing (an
+inductive invariant, the property holds). A satisfiable check from the initial states is a
+counterexample, from a larger R it may be spurious, then k is increased and R starts again from
+the initial states.
+
+The interpolants come from the resolution proofs of ProofSolver, a small CDCL solver that derives
+the McMillan partial interpolant of every clause it learns, interpolants are graphs over one input
+per latch in an AIG of their own.
+"""
+
+import logging
+from heapq import heapify, heappush, heappop
+
+from aig import AIG
+from bmc import Unroller
+from cnf import AIGCNF, iter_clauses
+from sim import random_cex
+from solver import make_solver
+from stats import Stats
+
+log = logging.getLogger(__name__)
+
+A, B = 0, 1
+
+
+def _luby(i):
+    # i-th element (from 0) of the Luby sequence 1 1 2 1 1 2 4 ...
+    size, seq = 1, 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i = i % size
+    return 1 << seq
+
+
+class ProofSolver:
+    """
+    CDCL solver over DIMACS clauses of two parts, A and B, that keeps the McMillan partial
+    interpolant of every clause as a literal of the AIG itp: the shared literals of an A clause,
+    true for a B clause, and for a resolvent the disjunction of the interpolants of its antecedents
+    when the pivot is local to A, else their conjunction. After an unsatisfiable solve,
+    interpolant() is the interpolant of the empty clause, implied by A and inconsistent with B.
+
+    Literals assigned at decision level 0 are resolved away with a derivation of their unit
+    clause, so every learned clause is the resolvent its interpolant belongs to.
+    """
+
+    def __init__(self, itp: AIG, shared):
+        """
+        :param shared: DIMACS variable -> literal of itp, for the variables A and B can share
+        """
+        self.itp = itp
+        self.shared = shared
+        # clauses as lists of literal codes, 2 * v for v and 2 * v + 1 for -v
+        self.clauses = []
+        self.parts = []
+        self.num_vars = 0
+        self.conflicts = 0
+        self.final = None
+        self.vals = []
+
+    def add_clause(self, clause, part):
+        """add a clause of DIMACS literals to part A or B"""
+        self.add_codes(_codes_of([clause]), part)
+
+    def add_codes(self, clauses, part):
+        """add clauses of literal codes without duplicate literals, the lists are taken over"""
+        self.clauses += clauses
+        self.parts.append((part, len(clauses)))
+        for c in clauses:
+            for x in c:
+                if x >> 1 > self.num_vars:
+                    self.num_vars = x >> 1
+
+    def _setup(self):
+        n = self.num_vars + 1
+        in_a, in_b = bytearray(n), bytearray(n)
+        pos = 0
+        for part, cnt in self.parts:
+            side = in_a if part == A else in_b
+            for c in self.clauses[pos : pos + cnt]:
+                for x in c:
+                    side[x >> 1] = 1
+            pos += cnt
+        self.a_local = bytearray(in_a[v] and not in_b[v] for v in range(n))
+        itp, shared = self.itp, self.shared
+        self.cl_itp = []
+        pos = 0
+        for part, cnt in self.parts:
+            if part == B:
+                self.cl_itp += [1] * cnt
+            for c in self.clauses[pos : pos + cnt] if part == A else ():
+                g = 0
+                for x in c:
+                    s = shared.get(x >> 1)
+                    if s is not None and in_b[x >> 1]:
+                        g = itp.add_or(g, s ^ (x & 1))
+                self.cl_itp.append(g)
+            pos += cnt
+
+    def resolve(self, i1, i2, v):
+        return self.itp.add_or(i1, i2) if self.a_local[v] else self.itp.add_and(i1, i2)
+
+    def solve(self):
+        """:return: whether A & B is satisfiable"""
+        self._setup()
+        n = self.num_vars + 1
+        clauses, cl_itp = self.clauses, self.cl_itp
+        self.vals = vals = [0] * (2 * n)  # by literal code: 1 true, -1 false, 0 unassigned
+        self.level = [0] * n
+        self.reason = [-1] * n
+        self.unit_itp = [0] * n
+        self.trail, self.trail_lim, self.qhead = [], [], 0
+        self.watches = watches = [[] for _ in range(2 * n)]
+        self.activity = [0.0] * n
+        self.var_inc = 1.0
+        self.phase = [1] * n  # code offset of the saved phase, negative first
+        self.heap = [(0.0, v) for v in range(1, n)]
+        heapify(self.heap)
+        units = []
+        for ci, c in enumerate(clauses):
+            if not c:
+                self.final = cl_itp[ci]
+                return False
+            if len(c) == 1:
+                units.append(ci)
+            else:
+                watches[c[0]].append(ci)
+                watches[c[1]].append(ci)
+        for ci in units:
+            l = clauses[ci][0]
+            if vals[l] == -1:
+                self.final = self.resolve(cl_itp[ci], self.unit_itp[l >> 1], l >> 1)
+                return False
+            if vals[l] == 0:
+                self.assign(l, ci)
+        restarts, budget = 0, 100 * _luby(0)
+        while True:
+            confl = self.propagate()
+            if confl >= 0:
+                self.conflicts += 1
+                budget -= 1
+                if not self.trail_lim:
+                    self.final = self.final_interpolant(confl)
+                    return False
+                learnt, bt, g = self.analyze(confl)
+                self.backtrack(bt)
+                ci = len(clauses)
+                clauses.append(learnt)
+                cl_itp.append(g)
+                if len(learnt) > 1:
+                    watches[learnt[0]].append(ci)
+                    watches[learnt[1]].append(ci)
+                self.assign(learnt[0], ci)
+                self.var_inc /= 0.95
+                if budget <= 0:
+                    restarts += 1
+                    budget = 100 * _luby(restarts)
+                    self.backtrack(0)
+            else:
+                v = self.pick()
+                if v is None:
+                    return True
+                self.trail_lim.append(len(self.trail))
+                self.assign(2 * v + self.phase[v], -1)
+
+    def assign(self, lit, ci):
+        vals = self.vals
+        vals[lit] = 1
+        vals[lit ^ 1] = -1
+        v = lit >> 1
+        self.level[v] = len(self.trail_lim)
+        self.reason[v] = ci
+        self.trail.append(lit)
+        if not self.trail_lim and ci >= 0:
+            # the unit clause of a level 0 literal, from its reason and the units of the others
+            g = self.cl_itp[ci]
+            for q in self.clauses[ci][1:]:
+                g = self.resolve(g, self.unit_itp[q >> 1], q >> 1)
+            self.unit_itp[v] = g
+
+    def propagate(self):
+        """:return: the index of a conflicting clause, -1 when there is none"""
+        vals, clauses, watches, trail = self.vals, self.clauses, self.watches, self.trail
+        while self.qhead < len(trail):
+            false_lit = trail[self.qhead] ^ 1
+            self.qhead += 1
+            ws = watches[false_lit]
+            keep = []
+            for idx, ci in enumerate(ws):
+                c = clauses[ci]
+                if c[0] == false_lit:
+                    c[0], c[1] = c[1], false_lit
+                first = c[0]
+                if vals[first] == 1:
+                    keep.append(ci)
+                    continue
+                for k in range(2, len(c)):
+                    if vals[c[k]] != -1:
+                        c[1], c[k] = c[k], false_lit
+                        watches[c[1]].append(ci)
+                        break
+                else:
+                    keep.append(ci)
+                    if vals[first] == -1:
+                        keep.extend(ws[idx + 1 :])
+                        watches[false_lit] = keep
+                        self.qhead = len(trail)
+                        return ci
+                    self.assign(first, ci)
+            watches[false_lit] = keep
+        return -1
+
+    def bump(self, v):
+        self.activity[v] += self.var_inc
+        if self.activity[v] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.var_inc *= 1e-100
+            self.heap = [(-self.activity[u], u) for u in range(1, len(self.activity)) if not self.vals[2 * u]]
+            heapify(self.heap)
+        elif not self.vals[2 * v]:
+            heappush(self.heap, (-self.activity[v], v))
+
+    def pick(self):
+        heap, vals = self.heap, self.vals
+        if len(heap) > 10 * len(vals):
+            self.heap = heap = [(-self.activity[u], u) for u in range(1, len(self.activity)) if not vals[2 * u]]
+            heapify(heap)
+        while heap:
+            v = heappop(heap)[1]
+            if not vals[2 * v]:
+                return v
+        return None
+
+    def analyze(self, confl):
+        """:return: the first UIP clause of the conflict, the level to go back to, its interpolant"""
+        clauses, level, reason, trail = self.clauses, self.level, self.reason, self.trail
+        cur = len(self.trail_lim)
+        seen = set()
+        learnt = [0]
+        g = self.cl_itp[confl]
+        lits = clauses[confl]
+        counter = 0
+        idx = len(trail) - 1
+        while True:
+            for q in lits:
+                v = q >> 1
+                if v in seen:
+                    continue
+                if level[v] == 0:
+                    # resolved with its unit clause on every occurrence
+                    g = self.resolve(g, self.unit_itp[v], v)
+                    continue
+                seen.add(v)
+                self.bump(v)
+                if level[v] == cur:
+                    counter += 1
+                else:
+                    learnt.append(q)
+            while trail[idx] >> 1 not in seen:
+                idx -= 1
+            p = trail[idx]
+            idx -= 1
+            counter -= 1
+            if counter == 0:
+                break
+            v = p >> 1
+            g = self.resolve(g, self.cl_itp[reason[v]], v)
+            lits = clauses[reason[v]][1:]
+        learnt[0] = p ^ 1
+        bt = 0
+        if len(learnt) > 1:
+            i = max(range(1, len(learnt)), key=lambda j: level[learnt[j] >> 1])
+            learnt[1], learnt[i] = learnt[i], learnt[1]
+            bt = level[learnt[1] >> 1]
+        return learnt, bt, g
+
+    def backtrack(self, lvl):
+        if len(self.trail_lim) <= lvl:
+            return
+        vals, trail, heap, activity = self.vals, self.trail, self.heap, self.activity
+        for lit in trail[self.trail_lim[lvl] :]:
+            v = lit >> 1
+            vals[lit] = vals[lit ^ 1] = 0
+            self.phase[v] = lit & 1
+            heappush(heap, (-activity[v], v))
+        del trail[self.trail_lim[lvl] :]
+        del self.trail_lim[lvl:]
+        self.qhead = len(trail)
+
+    def final_interpolant(self, confl):
+        # the empty clause, the conflict at level 0 resolved with the units of its literals
+        g = self.cl_itp[confl]
+        for q in self.clauses[confl]:
+            g = self.resolve(g, self.unit_itp[q >> 1], q >> 1)
+        return g
+
+    def interpolant(self):
+        return self.final
+
+
+def _codes_of(clauses):
+    # DIMACS clauses as lists of literal codes, see ProofSolver, without duplicate literals and
+    # tautologies (a gate with the same fanin twice)
+    res = []
+    for c in clauses:
+        codes = list(dict.fromkeys(2 * x if x > 0 else -2 * x + 1 for x in c))
+        if len(set(x >> 1 for x in codes)) == len(codes):
+            res.append(codes)
+    return res
+
+
+def _codes(flat):
+    return _codes_of(iter_clauses(flat))
+
+
+def encode_cone(aig: AIG, root, leaves, new_var, add_clause):
+    """
+    Tseitin encoding of the cone of the AIG literal root
+
+    :param leaves: AIG input variable -> DIMACS literal
+    :param new_var: function returning a fresh DIMACS variable
+    :return: the DIMACS literal of root
+    """
+    if root >> 1 == 0:
+        t = new_var()
+        add_clause([t])
+        return t if root & 1 else -t
+    lit_of = dict(leaves)
+
+    def m(l):
+        x = lit_of[l >> 1]
+        return -x if l & 1 else x
+
+    stack = [root >> 1]
+    while stack:
+        v = stack[-1]
+        if v in lit_of:
+            stack.pop()
+            continue
+        a, b = aig.fanin0[v], aig.fanin1[v]
+        pending = [x >> 1 for x in (a, b) if x >> 1 not in lit_of]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        g = new_var()
+        la, lb = m(a), m(b)
+        add_clause([-g, la])
+        add_clause([-g, lb])
+        add_clause([g, -la, -lb])
+        lit_of[v] = g
+    return m(root)
+
+
+class ITP:
+    def __init__(self, aig: AIG, solver="minisat22", filename="", sim_budget=0.5, stats: Stats = None):
+        """
+        :param aig: the system, its outputs are the bad states (see aig.AIG)
+        :param solver: SAT backend of the fixpoint checks and of the counterexample, the
+            interpolating checks run on ProofSolver
+        :param sim_budget: budget of sim.random_cex
+        :param stats: see stats.py
+        """
+        self.aig = aig
+        self.solver = solver
+        self.filename = filename
+        self.sim_budget = sim_budget
+        self.enc = AIGCNF(aig)
+        self.stats = Stats() if stats is None else stats
+        # interpolants and the reachable states are graphs over one input per latch
+        self.itp = AIG()
+        self.latch_in = [self.itp.add_input() for _ in aig.latches]
+        self.init = 1
+        for i, init in zip(self.latch_in, aig.inits):
+            if init < 2:
+                self.init = self.itp.add_and(self.init, i ^ (init ^ 1))
+        self.frames = []  # frame -> its clauses, see frame_codes
+        self.trans = []  # frame -> clauses of the transition to the next one
+        self.stats.collect("itp_ands", lambda: self.itp.num_ands)
+
+    def run(self, k=1000):
+        """
+        :return: (False, counterexample), (True, []) when an inductive invariant is found, None
+            when the bound is reached
+        """
+        try:
+            return self._run(k)
+        finally:
+            self.stats.dump()
+
+    def _run(self, max_k):
+        stats = self.stats
+        with stats.timer("random_sim"):
+            cex = random_cex(self.aig, self.sim_budget)
+        if cex is not None:
+            return False, cex
+        base = Unroller(self.enc, self.solver)
+        if base.check([base.bad()]):
+            log.info("Safty property Falsified: bad state is reachable from initial state!")
+            return False, base.trace()
+        for k in range(1, max_k + 1):
+            stats.gauge("depth", k)
+            log.info("Interpolating with %d transitions", k)
+            reach = self.init
+            while True:
+                stats.tick()
+                with stats.timer("itp_solve"):
+                    slv = self.check(reach, k)
+                    sat = slv.solve()
+                stats.inc("itp_conflicts", slv.conflicts)
+                if sat:
+                    if reach == self.init:
+                        return self.counterexample(base, k)
+                    # the approximation reaches bad, maybe spuriously, a longer B decides
+                    break
+                img = slv.interpolant()
+                stats.inc("interpolants")
+                with stats.timer("fixpoint"):
+                    fixpoint = not self.intersects(img, reach ^ 1)
+                if fixpoint:
+                    log.info("Safty property Proven: get inductive invariant")
+                    return True, []
+                reach = self.itp.add_or(reach, img)
+        log.info("Invariant couldn't be proven after %d transitions", max_k)
+        return None
+
+    def check(self, reach, k):
+        """A: reach in frame 0 and the transition to frame 1, B: k - 1 transitions on and bad in one of frames 1..k"""
+        enc, aig = self.enc, self.aig
+        shared = {enc.var(l >> 1, 1): i for l, i in zip(aig.latches, self.latch_in)}
+        slv = ProofSolver(self.itp, shared)
+        next_var = [enc.num_vars(k)]
+
+        def new_var():
+            next_var[0] += 1
+            return next_var[0]
+
+        leaves = {i >> 1: enc.var(l >> 1, 0) for l, i in zip(aig.latches, self.latch_in)}
+        r = encode_cone(self.itp, reach, leaves, new_var, lambda c: slv.add_clause(c, A))
+        slv.add_clause([r], A)
+        # the solver reorders the literals of its clauses, it gets copies of the encoded frames
+        slv.add_codes([c[:] for c in self.frame_codes(0) + self.trans_codes(0)], A)
+        for f in range(1, k + 1):
+            slv.add_codes([c[:] for c in self.frame_codes(f)], B)
+            if f < k:
+                slv.add_codes([c[:] for c in self.trans_codes(f)], B)
+        slv.add_clause([enc.bad_lit(f) for f in range(1, k + 1)], B)
+        return slv
+
+    def frame_codes(self, f):
+        # clauses of frame f and its constraints as literal codes, encoded once for all checks
+        while len(self.frames) <= f:
+            g = len(self.frames)
+            units = [[c] for c in self.enc.constraint_lits(g)]
+            self.frames.append(_codes(self.enc.frame_clauses(g)) + _codes_of(units))
+        return self.frames[f]
+
+    def trans_codes(self, f):
+        # clauses of the transition from frame f to f + 1 as literal codes
+        while len(self.trans) <= f:
+            self.trans.append(_codes(self.enc.trans_clauses(len(self.trans))))
+        return self.trans[f]
+
+    def intersects(self, a, b):
+        """whether the sets of latch states of the itp literals a and b intersect"""
+        slv = make_solver(self.solver)
+        leaves = {i >> 1: idx + 1 for idx, i in enumerate(self.latch_in)}
+        next_var = [len(self.latch_in)]
+
+        def new_var():
+            next_var[0] += 1
+            return next_var[0]
+
+        la = encode_cone(self.itp, a, leaves, new_var, slv.add_clause)
+        lb = encode_cone(self.itp, b, leaves, new_var, slv.add_clause)
+        res = slv.solve([la, lb])
+        slv.delete()
+        return res
+
+    def counterexample(self, base: Unroller, k):
+        # the shortest path to bad is at most k transitions long, the base unrolling finds it
+        while base.cnt < k:
+            base.add([-base.bad()])
+            base.unroll()
+            if base.check([base.bad()]):
+                log.info("Safty property Falsified: Found CEX after %d steps", base.cnt)
+                return False, base.trace()
+        raise RuntimeError(f"no counterexample within {k} transitions, the interpolating check found one")
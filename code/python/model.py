@@ -1,142 +1,88 @@
 """
-The parser for AAG
+The parser for AIGER (aag and aig)
 """
 
-import re
-from z3 import simplify, And, Not, Bool, Or
-import collections
+import logging
+import mmap
+from array import array
+from z3 import simplify, is_and, is_or, is_not, is_true, is_false, is_eq
+from z3 import is_bool, is_const, is_implies, is_app_of, Z3_OP_XOR, Z3_OP_ITE, Z3_OP_DISTINCT
+from aig import AIG
+
+log = logging.getLogger(__name__)
 
 
 class tCube:
-    # make a tcube object assosciated with frame t.
-    def __init__(self, t=0):
+    """
+    A cube (conjunction of literals) assosciated with frame t. Literals are AIGER style integers,
+    2 * var for the positive and 2 * var + 1 for the negated phase, kept as a sorted tuple so that
+    equality, hashing, subsumption and difference are linear merges. z3 terms are only built from
+    a cube at the solver boundary.
+    """
+
+    __slots__ = ("t", "lits")
+
+    def __init__(self, t=0, lits=()):
         self.t = t
-        self.cubeLiterals = list()
-        self.cube_ver = 0
-        self.liter_ver = 0
-        self._cube = None
+        self.lits = tuple(sorted(lits))
 
     def __lt__(self, other):
         return self.t < other.t
 
-    def __sub__(self, other):
-        literals = []
-        for c in self.cubeLiterals:
-            if c not in other.cubeLiterals:
-                literals.append(c)
-        return literals
+    def __len__(self):
+        return len(self.lits)
 
-    def clone(self):
-        ret = tCube(self.t)
-        ret.cubeLiterals = self.cubeLiterals.copy()
-        return ret
+    def __iter__(self):
+        return iter(self.lits)
 
     def __eq__(self, other):
-        return collections.Counter(self.cubeLiterals) == collections.Counter(other.cubeLiterals)
-
-    # TODO: Get model overhead is too high, using C API
-    def addModel(self, lMap, model, remove_input_or_not=True):
-        # addModel is used only when a bad cube is found, and this cube needs to be generalized
-        # later, since input can be assigned to any value and primed var is decided by var
-        # we can safely remove them as a preprocess:
-        # [i2, i4, i6, i8, i2', i4', i6' or v2, v4, v6] no_var_primes ->
-        # [i2, i4, i6, i8, v2, v4, v6]
-        no_var_primes = [l for l in model if str(l)[0] == "i" or not str(l).endswith("_prime")]
-        if remove_input_or_not:
-            no_input = [l for l in no_var_primes if str(l)[0] != "i"]  # no_input -> v2, v4, v6
-        else:
-            no_input = no_var_primes  # no_input -> i2, i4, i6, i8, i2', i4', i6' or v2, v4, v6
-        # self.add(simplify(And([lMap[str(l)] == model[l] for l in no_input]))) # HZ:
-        for l in no_input:
-            self._add(lMap[str(l)] == model[l])
-        self.liter_ver += 1
-
-    def remove_input(self):
-        index_to_remove = set()
-        for idx, literal in enumerate(self.cubeLiterals):
-            children = literal.children()
-            assert len(children) == 2
-            if str(children[0]) in ["True", "False"]:
-                v = str(children[1])
-            elif str(children[1]) in ["True", "False"]:
-                v = str(children[0])
+        return self.lits == other.lits
+
+    def __hash__(self):
+        return hash(self.lits)
+
+    def __sub__(self, other):
+        # literals of self that are not in other
+        a, b = self.lits, other.lits
+        i = j = 0
+        literals = []
+        while i < len(a):
+            if j == len(b) or a[i] < b[j]:
+                literals.append(a[i])
+                i += 1
+            elif a[i] == b[j]:
+                i += 1
+                j += 1
             else:
-                assert False
-            assert v[0] in ["i", "v"]
-            if v[0] == "i":
-                index_to_remove.add(idx)
-        self.cubeLiterals = [self.cubeLiterals[i] for i in range(len(self.cubeLiterals)) if i not in index_to_remove]
-        self.liter_ver += 1
-
-    def addAnds(self, ms):
-        for i in ms:
-            self._add(i)
-        self.liter_ver += 1
-
-    def _add(self, m):
-        self.cubeLiterals.append(m)
-
-    def join(self, model):
-        # first extract var,val from cubeLiteral
-        literal_idx_to_remove = set()
-        model = {str(var): model[var] for var in model}
-        for idx, literal in enumerate(self.cubeLiterals):
-            if literal is True:
-                continue
-            var, val = _extract(literal)
-            var = str(var)
-            assert var[0] == "v"
-            if var not in model:
-                literal_idx_to_remove.add(idx)
-                continue
-            val2 = model[var]
-            if str(val2) == str(val):
-                continue  # will not remove
-            literal_idx_to_remove.add(idx)
-        for idx in literal_idx_to_remove:
-            self.cubeLiterals[idx] = True
-        self.liter_ver += 1
-        return len(literal_idx_to_remove) != 0
+                j += 1
+        return literals
+
+    def subsumes(self, other):
+        # every literal of self occurs in other, i.e. the lemma Not(self) implies Not(other)
+        a, b = self.lits, other.lits
+        if len(a) > len(b):
+            return False
+        j = 0
+        for l in a:
+            while j < len(b) and b[j] < l:
+                j += 1
+            if j == len(b) or b[j] != l:
+                return False
+            j += 1
+        return True
+
+    def clone(self, t=None):
+        # the literals are sorted already, the copy shares them
+        c = tCube.__new__(tCube)
+        c.t = self.t if t is None else t
+        c.lits = self.lits
+        return c
 
     def delete(self, i: int):
-        lit_list = []
-        for it, v in enumerate(self.cubeLiterals):
-            if i == it:
-                lit_list.add(True)
-            else:
-                lit_list.add(v)
-        res = tCube(self.t)
-        res.addAnds(lit_list)
-        return res
-
-    def cube(self):
-        if self._cube is None:
-            self._cube = simplify(And(self.cubeLiterals))
-            self.cube_ver = self.liter_ver
-        elif self.cube_ver < self.liter_ver:
-            self._cube = simplify(And(self.cubeLiterals))
-            self.cube_ver = self.liter_ver
-        elif self.cube_ver > self.liter_ver:
-            raise ValueError("error!")
-        return self._cube
+        return tCube(self.t, self.lits[:i] + self.lits[i + 1 :])
 
     def __repr__(self):
-        return str(self.t) + ": " + str(sorted(self.cubeLiterals, key=str))
-
-
-def _extract(literaleq):
-    # we require the input looks like v==val
-    children = literaleq.children()
-    assert len(children) == 2
-    if str(children[0]) in ["True", "False"]:
-        v = children[1]
-        val = children[0]
-    elif str(children[1]) in ["True", "False"]:
-        v = children[0]
-        val = children[1]
-    else:
-        assert False
-    return v, val
+        return str(self.t) + ": " + str(list(self.lits))
 
 
 class Header:
@@ -150,141 +96,156 @@ class Header:
         self.invariants = nInvariant
 
 
-class Latch:
-    def __init__(self, _var: str, _next: str, _init: str):
-        self.var = _var
-        self.next = _next
-        self.init = _init
-
-    def __repr__(self):
-        return str(self.var) + ", " + str(self.next) + ", " + str(self.init)
-
-
-class AND:
-    def __init__(self, _lhs: str, _rhs0: str, _rhs1: str):
-        self.lhs = _lhs
-        self.rhs0 = _rhs0
-        self.rhs1 = _rhs1
+class AigerTables:
+    """
+    Array-backed tables of an AIGER file. Every entry is an AIGER literal, latch i is
+    latches[i] with next state nexts[i] and reset inits[i] (0, 1 or the latch literal itself when
+    uninitialized), AND gate i is and_lhs[i] = and_rhs0[i] & and_rhs1[i].
+    """
 
-    def __repr__(self):
-        return str(self.lhs) + ", " + str(self.rhs0) + ", " + str(self.rhs1)
+    def __init__(self, header: Header, binary: bool):
+        self.header = header
+        self.binary = binary
+        self.inputs = array("I")
+        self.latches = array("I")
+        self.nexts = array("I")
+        self.inits = array("I")
+        self.outputs = array("I")
+        self.bads = array("I")
+        self.invariants = array("I")
+        self.and_lhs = array("I")
+        self.and_rhs0 = array("I")
+        self.and_rhs1 = array("I")
+        # symbol table, kind ("i", "l", "o", "b", "c") -> {position: name}
+        self.symbols = {k: dict() for k in "ilobc"}
+        self.comments = list()
+
+
+def _read_literals(buf, n: int, out: array, fileName: str):
+    for _ in range(n):
+        line = buf.readline().split()
+        if len(line) != 1:
+            log.error("Error in %s: expected a literal, got %s", fileName, line)
+            exit(1)
+        out.append(int(line[0]))
 
 
 def read_in(fileName: str):
     """
+    Streaming reader for ASCII (aag) and binary (aig) AIGER files. The file is memory mapped and
+    decoded in a single pass, the delta encoded AND gates of the binary format are decoded straight
+    from the mapped buffer, so no conversion through aigtoaig is needed.
+
     :param fileName:
-    :return: inputs, latches, outputs, ands, bads, invariants, annotations
+    :return: AigerTables
     """
-    inputs = list()
-    outputs = list()
-    bads = list()
-    latches = list()
-    ands = list()
-    invariants = list()
-    annotations = list()
-
-    HEADER_PATTERN = re.compile("aag (\d+) (\d+) (\d+) (\d+) (\d+)(?: (\d+))?(?: (\d+))?\n")
-    IO_PATTERN = re.compile("(\d+)\n")
-    LATCH_PATTERN = re.compile("(\d+) (\d+)(?: (\d+))?\n")
-    AND_PATTERN = re.compile("(\d+) (\d+) (\d+)\n")
-    ANNOTATION_PATTERN = re.compile("\S+ (\S+)\n")
-
-    with open(fileName, "r") as f:
-        head_line = f.readline()
-        cont = re.match(HEADER_PATTERN, head_line)
-        if cont is None:
-            print("Don't support constraint, fairness, justice property yet")
+    with open(fileName, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        head = buf.readline().split()
+        if len(head) < 6 or head[0] not in (b"aag", b"aig"):
+            log.error("Error in %s: not an AIGER file", fileName)
+            exit(1)
+        fields = [int(x) for x in head[1:]] + [0] * (10 - len(head))
+        if fields[7] != 0 or fields[8] != 0:
+            log.error("Don't support fairness, justice property yet")
             exit(1)
+        header = Header(*fields[:7])
+        binary = head[0] == b"aig"
+        tables = AigerTables(header, binary)
 
-        header = Header(
-            int(cont.group(1)),
-            int(cont.group(2)),
-            int(cont.group(3)),
-            int(cont.group(4)),
-            int(cont.group(5)),
-            int(cont.group(6)) if cont.group(6) is not None else 0,
-            int(cont.group(7)) if cont.group(7) is not None else 0,
-        )
-
-        input_num = header.inputs
-        output_num = header.outputs
-        bad_num = header.bads
-        latch_num = header.latches
-        and_num = header.ands
-        invariant_num = header.invariants
-
-        for line in f.readlines():
-            if input_num > 0:
-                h = re.match(IO_PATTERN, line)
-                if h:
-                    # print("input node")
-                    inputs.append(h.group(1))
-                    # print(str(h.group(1)))
-                    input_num -= 1
-            elif latch_num > 0:
-                h = re.match(LATCH_PATTERN, line)
-                if h:
-                    # print("latches node")
-                    if h.group(3) is None:
-                        # print(h.groups())
-                        latches.append(Latch(h.group(1), h.group(2), "0"))
-                    else:
-                        # print(h.groups())
-                        latches.append(Latch(h.group(1), h.group(2), h.group(3)))
-                    latch_num -= 1
-            elif output_num > 0:
-                h = re.match(IO_PATTERN, line)
-                if h:
-                    # print("output node")
-                    outputs.append(h.group(1))
-                    # print(str(h.group(1)))
-                    output_num -= 1
-            elif bad_num > 0:
-                h = re.match(IO_PATTERN, line)
-                if h:
-                    # print("bad node")
-                    bads.append(h.group(1))
-                    # print(str(h.group(1)))
-                    bad_num -= 1
-            elif invariant_num > 0:
-                h = re.match(IO_PATTERN, line)
-                if h:
-                    # print("invariant node")
-                    invariants.append(h.group(1))
-                    # print(str(h.group(1)))
-                    invariant_num -= 1
-            elif and_num > 0:
-                h = re.match(AND_PATTERN, line)
-                if h:
-                    # print("and node")
-                    # print(str(h.groups()))
-                    ands.append(AND(h.group(1), h.group(2), h.group(3)))
-                    and_num -= 1
-            else:
-                h = re.match(ANNOTATION_PATTERN, line)
-                if h:
-                    annotations.append(h.group(1))
-        return inputs, latches, outputs, ands, bads, invariants, annotations
+        # inputs, implicit in the binary format
+        if binary:
+            tables.inputs.extend(range(2, 2 * header.inputs + 2, 2))
+        else:
+            _read_literals(buf, header.inputs, tables.inputs, fileName)
+
+        # latches: [lit] next [init]
+        lit = 2 * header.inputs
+        for _ in range(header.latches):
+            line = [int(x) for x in buf.readline().split()]
+            if binary:
+                lit += 2
+                line.insert(0, lit)
+            if len(line) not in (2, 3):
+                log.error("Error in %s: bad latch definition %s", fileName, line)
+                exit(1)
+            tables.latches.append(line[0])
+            tables.nexts.append(line[1])
+            tables.inits.append(line[2] if len(line) == 3 else 0)
+
+        _read_literals(buf, header.outputs, tables.outputs, fileName)
+        _read_literals(buf, header.bads, tables.bads, fileName)
+        _read_literals(buf, header.invariants, tables.invariants, fileName)
+
+        # and gates
+        if binary:
+            lhs_out, rhs0_out, rhs1_out = tables.and_lhs, tables.and_rhs0, tables.and_rhs1
+            pos = buf.tell()
+            lhs = 2 * (header.inputs + header.latches)
+            for _ in range(header.ands):
+                lhs += 2
+                # two 7-bit varints: delta0 = lhs - rhs0, delta1 = rhs0 - rhs1
+                x, shift = 0, 0
+                while True:
+                    b = buf[pos]
+                    pos += 1
+                    x |= (b & 0x7F) << shift
+                    if b < 0x80:
+                        break
+                    shift += 7
+                rhs0 = lhs - x
+                x, shift = 0, 0
+                while True:
+                    b = buf[pos]
+                    pos += 1
+                    x |= (b & 0x7F) << shift
+                    if b < 0x80:
+                        break
+                    shift += 7
+                lhs_out.append(lhs)
+                rhs0_out.append(rhs0)
+                rhs1_out.append(rhs0 - x)
+            buf.seek(pos)
+        else:
+            for _ in range(header.ands):
+                line = buf.readline().split()
+                if len(line) != 3:
+                    log.error("Error in %s: bad and gate definition %s", fileName, line)
+                    exit(1)
+                tables.and_lhs.append(int(line[0]))
+                tables.and_rhs0.append(int(line[1]))
+                tables.and_rhs1.append(int(line[2]))
+
+        # symbol table and comments
+        line = buf.readline()
+        while line:
+            line = line.rstrip(b"\r\n")
+            if line == b"c":
+                tables.comments = [l.decode(errors="replace") for l in buf.read().splitlines()]
+                break
+            kind = chr(line[0]) if line else ""
+            if kind in tables.symbols:
+                pos, _, name = line[1:].partition(b" ")
+                tables.symbols[kind][int(pos)] = name.decode(errors="replace")
+            line = buf.readline()
+        return tables
+    finally:
+        buf.close()
 
 
 class Model:
     def __init__(self):
-        # the core of this class is three attributes: trans, init and post
-        # the meaning of 'prime' is the next state of this variable
-        self.inputs = []
-        self.vars = []
-        self.primed_vars = []
-        self.primed_inputs = []
-        self.trans = tCube()
-        self.init = tCube()
-        self.post = tCube()
-        self.primed_inputs = []
+        # the And-Inverter Graph handed to the engines, read from a file or built from z3 formulas
+        self.aig = None
         self.filename = ""
 
     def parse(self, fileName):
         """
-        read_in function reads file and return the parsed items, both i and o are str type,
-        but latch and and gate are already a list of custom ojects.
+        read_in function reads the file and returns its array-backed tables, which are turned into
+        an And-Inverter Graph (structurally hashed, constants propagated) and reduced to the cone
+        of influence of the outputs. The engines encode that graph to CNF themselves, so
+        irrelevant logic never reaches the solver.
 
         latch is the relation for transition (now -> next),
         input is for initilazation
@@ -292,193 +253,83 @@ class Model:
         output (normally only 1 variable) is for sat checking at the outer loop
         """
         self.filename = fileName
-        i, l, o, a, b, c, annotations = read_in(fileName)
-
-        ann_i = 0
-        # input node
-        inp = dict()
-        self.inputs = list()
-        for it in i:
-            if ann_i < len(annotations):
-                name = "i" + it + "[" + annotations[ann_i] + "]"
-            else:
-                name = "i" + it
-            ann_i += 1
-            inp[it] = Bool(name)
-            self.inputs.append(inp[it])
-
-        # input'
-        pinp = dict()
-        self.primed_inputs = list()
-        for it in i:
-            pinp[it] = Bool(str(inp[it]) + "_prime")  # v -> v_prime, change this, because we want generate .smt2 later
-            self.primed_inputs.append(pinp[it])
-        print("inputs: ", self.inputs)
-
-        # vars of latch
-        vs = dict()
-        self.vars = list()
-        for it in l:
-            if ann_i < len(annotations):
-                name = "v" + it.var + "[" + annotations[ann_i] + "]"
-            else:
-                name = "v" + it.var
-            ann_i += 1
-            vs[it.var] = Bool(name)
-            self.vars.append(vs[it.var])
-
-        # vars' of latch
-        pvs = dict()
-        self.primed_vars = list()
-        for it in l:
-            # pvs[it.var] = Bool(str(vs[it.var]) + '\'')
-            pvs[it.var] = Bool(
-                str(vs[it.var]) + "_prime"
-            )  # v -> v_prime, change this, because we want generate .smt2 later
-            self.primed_vars.append(pvs[it.var])
-
-        # and gate node => And(and1, and2)
-        ands = dict()
-        for it in a:
-            rs0 = True
-            rs1 = True
-            if it.rhs0 == "1":
-                rs0 = True
-            elif it.rhs0 == "0":
-                rs0 = False
-            elif int(it.rhs0) & 1 != 0:
-                v = str(int(it.rhs0) - 1)
-                if v in inp.keys():
-                    rs0 = Not(inp[v])
-                elif v in vs.keys():
-                    rs0 = Not(vs[v])
-                elif v in ands.keys():
-                    rs0 = Not(ands[v])
-                else:
-                    print("Error in AND definition, in node " + v)
-                    exit(1)
-            else:
-                v = it.rhs0
-                if v in inp.keys():
-                    rs0 = inp[v]
-                elif v in vs.keys():
-                    rs0 = vs[v]
-                elif v in ands.keys():
-                    rs0 = ands[v]
-                else:
-                    print("Error in AND definition, in node " + v)
-                    exit(1)
+        self.aig = AIG.from_tables(read_in(fileName)).coi()
+        log.info("%s", self.aig)
+        return self.aig
 
-            if it.rhs1 == "1":
-                rs1 = True
-            elif it.rhs1 == "0":
-                rs1 = False
-            elif int(it.rhs1) & 1 != 0:
-                v = str(int(it.rhs1) - 1)
-                if v in inp.keys():
-                    rs1 = Not(inp[v])
-                elif v in vs.keys():
-                    rs1 = Not(vs[v])
-                elif v in ands.keys():
-                    rs1 = Not(ands[v])
-                else:
-                    print("Error in AND definition, in node " + v)
-                    exit(1)
-            else:
-                v = it.rhs1
-                if v in inp.keys():
-                    rs1 = inp[v]  # input
-                elif v in vs.keys():
-                    rs1 = vs[v]  # vars of latch (in dict)
-                elif v in ands.keys():
-                    rs1 = ands[v]
-                else:
-                    print("Error in AND definition, in node " + v)
-                    exit(1)
-            ands[it.lhs] = And(rs0, rs1)
-
-        # initial condition, init = And(inits{Bool(latch_node)})
-        inits_var = list()
-        for it in l:
-            if it.init == "0":
-                inits_var.append(Not(vs[it.var]))
-            elif it.init == "1":
-                inits_var.append(vs[it.var])
-        self.init.addAnds(inits_var)
-
-        # transition. trans_items: asserts.
-        trans_items = list()
-        for it in l:
-            if it.next == "1":
-                trans_items.append(pvs[it.var] == And(True))
-            elif it.next == "0":
-                trans_items.append(pvs[it.var] == And(False))
-            elif int(it.next) & 1 == 0:
-                v = it.next
-                if v in inp.keys():
-                    trans_items.append(pvs[it.var] == inp[v])
-                elif v in vs.keys():
-                    trans_items.append(pvs[it.var] == vs[v])
-                elif v in ands.keys():
-                    trans_items.append(pvs[it.var] == ands[v])
-                else:
-                    print("Error in transition relation")
-                    exit(1)
-            else:
-                v = str(int(it.next) - 1)
-                if v in inp.keys():
-                    trans_items.append(pvs[it.var] == Not(inp[v]))
-                elif v in vs.keys():
-                    trans_items.append(pvs[it.var] == Not(vs[v]))
-                elif v in ands.keys():
-                    trans_items.append(pvs[it.var] == Not(ands[v]))
-                else:
-                    print("Error in transition relation")
-                    exit(1)
-        self.trans.addAnds(trans_items)
-
-        print("trans:", self.trans.cube())
-        # postulate
-        # output formula with ands
-        property_items = list()
-        for it in o:
-            tmp = int(it)
-            if tmp & 1 == 0:  # 0 -> False
-                if it in inp.keys():
-                    property_items.append(Not(inp[it]))
-                elif it in vs.keys():
-                    property_items.append(Not(vs[it]))
-                elif it in ands.keys():
-                    property_items.append(Not(ands[it]))
-                else:
-                    print("Error in property definition")
-                    exit(1)
-            else:
-                it = str(int(it) - 1)
-                if it in inp.keys():
-                    property_items.append(inp[it])
-                elif it in vs.keys():
-                    property_items.append(vs[it])
-                elif it in ands.keys():
-                    property_items.append(ands[it])
-                else:
-                    print("Error in property definition")
-                    exit(1)
+    def from_z3(self, variables, primes, init, trans, post):
+        """
+        Build the graph of a system given as z3 formulas. Every variable becomes an uninitialized
+        latch whose next state is a fresh input standing for its primed copy, so a relational
+        trans over variables and primes turns into an invariant constraint. Constants that are
+        neither variables nor primes are free inputs.
 
-        self.post.addAnds(property_items)
-        print("postAdded")
-        print("self.inputs: ", self.inputs)
-        print("self.vars: ", self.vars)
-        return (
-            self.inputs,
-            self.primed_inputs,
-            self.vars,
-            self.primed_vars,
-            self.init,
-            self.trans,
-            self.post,
-            self.filename,
-        )
+        :param init: a cube over variables, variables it does not mention start free
+        :param post: the safety property, its negation is the output
+        """
+        aig = AIG()
+        lit_of_id = dict()
+        for v in variables:
+            lit_of_id[v.get_id()] = aig.add_latch(None, str(v))
+        for idx, p in enumerate(primes):
+            lit = aig.add_input(str(p))
+            lit_of_id[p.get_id()] = lit
+            aig.set_next(idx, lit)
+        latch_pos = {l >> 1: idx for idx, l in enumerate(aig.latches)}
+        init = simplify(init)
+        for a in init.children() if is_and(init) else [init]:
+            neg = is_not(a)
+            lit = lit_of_id.get((a.arg(0) if neg else a).get_id())
+            if lit is None or lit >> 1 not in latch_pos:
+                if is_true(a):
+                    continue
+                raise ValueError(f"init must be a cube over the state variables, got {a}")
+            aig.inits[latch_pos[lit >> 1]] = 0 if neg else 1
+        memo = dict()
+        aig.constraints.append(_z3_to_aig(trans, aig, lit_of_id, memo))
+        aig.outputs.append(_z3_to_aig(post, aig, lit_of_id, memo) ^ 1)
+        self.aig = aig
+        return aig
+
+
+def _z3_to_aig(e, aig: AIG, lit_of_id: dict, memo: dict):
+    """AIG literal of a Boolean z3 term, shared subterms are translated once"""
+    key = e.get_id()
+    if key in memo:
+        return memo[key]
+    if not is_bool(e):
+        raise ValueError(f"only Boolean formulas can be turned into a graph, got {e}")
+    args = [_z3_to_aig(c, aig, lit_of_id, memo) for c in e.children()]
+    if is_true(e):
+        lit = 1
+    elif is_false(e):
+        lit = 0
+    elif is_const(e):
+        lit = lit_of_id.get(key)
+        if lit is None:
+            lit = lit_of_id[key] = aig.add_input(str(e))
+    elif is_not(e):
+        lit = args[0] ^ 1
+    elif is_and(e):
+        lit = 1
+        for a in args:
+            lit = aig.add_and(lit, a)
+    elif is_or(e):
+        lit = 0
+        for a in args:
+            lit = aig.add_or(lit, a)
+    elif is_implies(e):
+        lit = aig.add_or(args[0] ^ 1, args[1])
+    elif is_app_of(e, Z3_OP_XOR) or (is_app_of(e, Z3_OP_DISTINCT) and len(args) == 2):
+        lit = aig.add_xor(args[0], args[1])
+    elif is_eq(e) and len(args) == 2:
+        lit = aig.add_xor(args[0], args[1]) ^ 1
+    elif is_app_of(e, Z3_OP_ITE):
+        lit = aig.add_mux(args[0], args[1], args[2])
+    else:
+        raise ValueError(f"unsupported operator in {e}")
+    memo[key] = lit
+    return lit
 
 
 if __name__ == "__main__":
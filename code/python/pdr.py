@@ -1,194 +1,555 @@
-from z3 import *
-from queue import PriorityQueue
+import logging
+from collections import defaultdict
+from heapq import heappush, heappop
 
 import sys
 from os import path as osp
 
 root = osp.abspath(osp.join(__file__, "../../../"))
-print(f"project root: {root}")
 sys.path.append(root)
 from model import tCube
+from aig import AIG
+from cnf import AIGCNF
+from solver import make_solver
+from sim import TernarySim, random_cex
+from stats import Stats
+from witness import Counterexample
 
+log = logging.getLogger(__name__)
 
-def get_trace_from_PQ(pq):
-    trace = list()
-    while not pq.empty():
-        idx, cube = pq.get()
-        trace.append(cube)
-    return trace
 
+class Obligation:
+    """
+    A cube to block and the inputs that take every state of it into the states of its successor
+    obligation, or make the bad literal true for the bad cube (succ is None). Following succ from a
+    cube holding an initial state gives the counterexample, depth is the length of that chain.
+    """
 
-def debug_printQ(Q):
-    Q_ = copy.deepcopy(Q)
-    while not Q_.empty():
-        print(Q_.get())
+    __slots__ = ("cube", "inputs", "succ", "depth")
+
+    def __init__(self, cube: tCube, inputs, succ=None):
+        self.cube = cube
+        self.inputs = inputs
+        self.succ = succ
+        self.depth = 0 if succ is None else succ.depth + 1
+
+    def __repr__(self):
+        return repr(self.cube)
+
+
+class ObligationQueue:
+    """
+    Proof obligations of PDR, kept for the whole run. The heap is ordered by frame, lowest first,
+    then by depth, deepest first, so the obligation closest to the initial states goes first, and
+    holds a cube at most once per frame. Obligations blocked in the last frame are parked and
+    queued again in the frame added next, they are pushed forward instead of found again from new
+    bad cubes. Above max_size obligations the oldest parked ones are evicted, then the queued ones
+    of the highest frames, losing them only costs the work of finding them again.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.heap = []  # (frame, -depth, sequence number, obligation)
+        self.queued = set()  # (frame, cube) of the obligations in the heap
+        self.parked = []
+        self.seq = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, ob: Obligation):
+        key = (ob.cube.t, ob.cube)
+        if key in self.queued:
+            return
+        self.queued.add(key)
+        self.seq += 1
+        heappush(self.heap, (ob.cube.t, -ob.depth, self.seq, ob))
+        if len(self.heap) + len(self.parked) > self.max_size:
+            self.evict()
+
+    def pop(self):
+        ob = heappop(self.heap)[3]
+        self.queued.discard((ob.cube.t, ob.cube))
+        return ob
+
+    def park(self, ob: Obligation):
+        self.parked.append(ob)
+        if len(self.heap) + len(self.parked) > self.max_size:
+            self.evict()
+
+    def reopen(self, frame):
+        """queue the parked obligations in frame, the frame added last, :return: how many there were"""
+        parked, self.parked = self.parked, []
+        for ob in parked:
+            self.push(Obligation(ob.cube.clone(frame), ob.inputs, ob.succ))
+        return len(parked)
+
+    def evict(self):
+        # down to three quarters of the limit, so that the next pushes do not evict again
+        excess = len(self.heap) + len(self.parked) - self.max_size * 3 // 4
+        drop = min(excess, len(self.parked))
+        del self.parked[:drop]
+        excess -= drop
+        if excess > 0:
+            # a sorted list is a heap
+            self.heap.sort()
+            for entry in self.heap[len(self.heap) - excess :]:
+                self.queued.discard((entry[0], entry[3].cube))
+            del self.heap[len(self.heap) - excess :]
+        self.evicted += drop + max(excess, 0)
+
+
+class FrameSolver:
+    """
+    Incremental solver bound to one frame F_i. The transition relation (gates of the current
+    frame and the latch links to the next one), the constraints and the frame formula are asserted
+    once when the frame is created, lemmas are added as they are learned, and every query is posed
+    through assumption literals, so a check only costs as much as the cube it asks about.
+    """
+
+    def __init__(self, enc: AIGCNF, solver: str, init=False):
+        self.slv = make_solver(solver)
+        self.slv.add_clauses(enc.frame_template)
+        self.slv.add_clauses(enc.trans_template)
+        for c in enc.constraint_lits(0):
+            self.slv.add_clause([c])
+        if init:
+            self.slv.add_clauses(enc.init_clauses())
+        # activation literals are numbered after the two time frames of the encoding
+        self.next_act = enc.num_vars(1) + 1
+        # clauses added since the solver was created, a query that was sat stays sat until it grows
+        self.added = 0
+        self.last_core = []  # core of the last unsat query
+
+    def add(self, clause):
+        self.slv.add_clause(clause)
+        self.added += 1
+
+    def check(self, assumptions):
+        res = self.slv.solve(assumptions)
+        self.last_core = [] if res else self.slv.core()
+        return res
+
+    def check_clauses(self, clauses, assumptions=()):
+        # temporary clauses are guarded by a fresh activation literal, which is retired afterwards
+        # so they never constrain later queries
+        act = self.new_var()
+        for c in clauses:
+            self.slv.add_clause([-act] + c)
+        res = self.slv.solve([act] + list(assumptions))
+        # the core is taken before the retiring clause, some backends (CaDiCaL) drop it on any
+        # new clause
+        self.last_core = [] if res else self.slv.core()
+        self.slv.add_clause([-act])
+        return res
+
+    def new_var(self):
+        self.next_act += 1
+        return self.next_act - 1
+
+    def value(self, lit):
+        return self.slv.value(lit)
+
+    def core(self):
+        return self.last_core
 
 
 class PDR:
-    def __init__(self, inputs, primed_inputs, vars, primed_vars, init, trans, post, filename):
-        self.vars = vars + inputs
-        self.primed_vars = primed_vars + primed_inputs
-        self.init = init
-        self.trans = trans
-        self.post = post
+    def __init__(
+        self,
+        aig: AIG,
+        solver="minisat22",
+        filename="",
+        mic_attempts=3,
+        ctg_max=3,
+        ctg_depth=1,
+        lift=True,
+        sim_budget=0.5,
+        stats: Stats = None,
+        max_obligations=100000,
+        lemma_out=None,
+    ):
+        """
+        :param aig: the system, its outputs are the bad states (see aig.AIG)
+        :param solver: SAT backend, see solver.SOLVERS
+        :param mic_attempts: failed literal drops in a row before MIC gives up, 0 keeps the unsat core
+        :param ctg_max: counterexamples to generalization blocked before joining, per literal drop
+        :param ctg_depth: nesting depth of MIC calls made while blocking counterexamples to generalization
+        :param lift: shrink predecessor cubes by ternary simulation instead of keeping every latch
+        :param sim_budget: budget of sim.random_cex
+        :param stats: see stats.py
+        :param max_obligations: proof obligations kept before some are evicted, see ObligationQueue
+        :param lemma_out: queue that lemmas proven to be invariants are put to as clauses of latch
+            literals, e.g. for the step case of k-induction, see export_invariants
+        """
+        self.aig = aig
+        self.solver = solver
         self.filename = filename
-        self.frames = [self.init]
-        self.lMap = {str(l): l for l in self.vars}
-        self.primeMap = [(self.vars[i], self.primed_vars[i]) for i in range(len(self.vars))]
+        self.enc = AIGCNF(aig)
+        # DIMACS literals of cube literal l in the current and in the next time frame, cube
+        # literals are the AIGER literals of the latches
+        self.cur_lits = self.enc.lit_table(0)
+        self.next_lits = self.enc.lit_table(1)
+        self.init_cube = [l ^ (init ^ 1) for l, init in zip(aig.latches, aig.inits) if init < 2]
+        self.init_set = set(self.init_cube)
+        self.mic_attempts = mic_attempts
+        self.ctg_max = ctg_max
+        self.ctg_depth = ctg_depth
+        self.sim_budget = sim_budget
+        self.sim = TernarySim(aig) if lift else None
+        # next state function of each latch variable
+        self.next_of = {l >> 1: nxt for l, nxt in zip(aig.latches, aig.nexts)}
+        # delta encoded frames: every lemma is stored once, in frames[i] for its highest level i,
+        # F_i (i > 0) is the conjunction of the negations of the cubes in frames[i:] and F_0 is the
+        # initial states. Lemmas are indexed by literal to find subsumed and subsuming ones.
+        self.frames = [set()]
+        self.level = dict()  # lemma cube -> its level
+        self.occurs = defaultdict(set)  # literal -> lemma cubes containing it
+        # one persistent solver per frame, frame i holds F_i & T
+        self.solvers = [FrameSolver(self.enc, solver, init=True)]
+        self.obligations = ObligationQueue(max_obligations)
+        # lemma -> (its level, clauses of the solver of that level) when it last failed to be pushed
+        self.push_failed = dict()
+        self.lemma_out = lemma_out
+        # lemmas exported as invariants, asserted in a solver of their own that has an activation
+        # literal for every lemma that was a candidate
+        self.exported = set()
+        self.inv_solver = None
+        self.inv_act = dict()
+        self.stats = Stats() if stats is None else stats
+        self.stats.collect("lemmas_per_frame", lambda: [len(f) for f in self.frames])
+        self.stats.collect("conflicts_per_frame", lambda: [s.slv.conflicts() for s in self.solvers])
+        self.stats.collect("obligations_evicted", lambda: self.obligations.evicted)
 
     def add_new_frame(self):
-        print(f"Adding new frame {len(self.frames)}...")
-        new_frame = self.post.clone()
-        new_frame.t = len(self.frames)
-        self.frames.append(new_frame)
+        log.info("Adding new frame %d...", len(self.frames))
+        self.stats.inc("frames")
+        self.stats.tick()
+        self.frames.append(set())
+        self.solvers.append(FrameSolver(self.enc, self.solver))
+
+    def add_lemma(self, cube: tCube, i):
+        """
+        The lemma learned from a blocked cube is its negation, it is stored at level i and added to
+        the solvers of frames 1..i. Nothing happens when a lemma at level >= i already implies it,
+        lemmas at levels <= i it implies are dropped from the frames (their clauses stay in the
+        solvers, where they are redundant now).
+        """
+        if self.subsumed(cube, i):
+            return
+        self.stats.inc("lemmas")
+        lo = 1
+        for c in self.subsumed_by(cube):
+            if self.level[c] <= i:
+                if c == cube:
+                    # the lemma moves up, lower solvers already hold it
+                    lo = self.level[c] + 1
+                self.remove_lemma(c)
+        cube = cube.clone(i)
+        self.frames[i].add(cube)
+        self.level[cube] = i
+        for l in cube.lits:
+            self.occurs[l].add(cube)
+        clause = [-self.cur_lits[l] for l in cube.lits]
+        for j in range(lo, i + 1):
+            self.solvers[j].add(clause)
+
+    def remove_lemma(self, cube: tCube):
+        self.frames[self.level.pop(cube)].discard(cube)
+        self.push_failed.pop(cube, None)
+        for l in cube.lits:
+            self.occurs[l].discard(cube)
+
+    def subsumed(self, cube: tCube, i):
+        # some lemma at level >= i has all its literals in cube
+        hits = defaultdict(int)
+        for l in cube.lits:
+            for c in self.occurs[l]:
+                hits[c] += 1
+                if hits[c] == len(c) and self.level[c] >= i:
+                    return True
+        return False
+
+    def subsumed_by(self, cube: tCube):
+        # lemmas having all the literals of cube, looked up from its rarest literal
+        if not cube.lits:
+            return list(self.level)
+        rarest = min(cube.lits, key=lambda l: len(self.occurs[l]))
+        return [c for c in self.occurs[rarest] if cube.subsumes(c)]
+
+    def _assumptions(self, cube: tCube, prime=False):
+        lits = self.next_lits if prime else self.cur_lits
+        return [lits[l] for l in cube.lits]
+
+    def cube_from_model(self, slv: FrameSolver, t, targets=()):
+        """
+        Predecessor cube over the current latches of the model. Inputs can be assigned to any
+        value and the next frame is decided by the current one, so they are left out. With
+        lifting, only the latches needed to keep the targets (AIG literals of the current frame)
+        and the constraints true under the inputs of the model are kept.
+        """
+        value = slv.value
+        state = [l if value(self.cur_lits[l]) else l ^ 1 for l in self.aig.latches]
+        if self.sim is None:
+            return tCube(t, state)
+        inputs = [l if value(self.cur_lits[l]) else l ^ 1 for l in self.aig.inputs]
+        return tCube(t, self.sim.lift(state, inputs, list(targets) + list(self.aig.constraints)))
+
+    def next_targets(self, cube: tCube):
+        # the next state functions that put a successor in cube
+        return [self.next_of[l >> 1] ^ (l & 1) for l in cube.lits]
+
+    def model_inputs(self, slv: FrameSolver):
+        return [int(slv.value(self.cur_lits[l])) for l in self.aig.inputs]
+
+    def trace(self, ob: Obligation):
+        """
+        Counterexample from an obligation that holds an initial state: its latches start in their
+        initial value or the value in the cube (0 when neither says), and the inputs stored along
+        the successor chain take that state to the bad states.
+        """
+        values = {l >> 1: (l & 1) ^ 1 for l in ob.cube.lits}
+        init = [i if i < 2 else values.get(l >> 1, 0) for l, i in zip(self.aig.latches, self.aig.inits)]
+        inputs = []
+        while ob is not None:
+            inputs.append(ob.inputs)
+            ob = ob.succ
+        return Counterexample(init, inputs)
 
     def run(self):
-        cube = self.getBadCube(base=True)
-        if cube:
-            print(f"Safty property Falsified: bad state is reachable from initial state!")
-            return False, [cube]
-        print("Passed base check: I&P")
+        """
+        :return: (False, counterexample) or (True, the lemmas of the inductive invariant)
+        """
+        try:
+            return self._run()
+        finally:
+            self.stats.dump()
+
+    def _run(self):
+        with self.stats.timer("random_sim"):
+            cex = random_cex(self.aig, self.sim_budget)
+        if cex is not None:
+            return False, cex
+        cube = self.getBadCube()
+        if cube is not None:
+            log.info("Safty property Falsified: bad state is reachable from initial state!")
+            return False, self.trace(Obligation(cube, self.model_inputs(self.solvers[0])))
+        log.info("Passed base check: I&P")
         self.add_new_frame()
         while True:
-            cube = self.getBadCube(base=False)
-            if cube is not None:
+            # obligations carried over to the last frame go before new bad cubes
+            if not self.obligations:
+                cube = self.getBadCube()
+                if cube is not None:
+                    self.obligations.push(Obligation(cube, self.model_inputs(self.solvers[-1])))
+            if self.obligations:
                 # Recursive blocking stage
-                trace = self.recBlockCube(cube)
+                trace = self.recBlockCube()
                 if trace is not None:
-                    print(f"Safty property Falsified: Found CEX after {len(self.frames)} steps")
+                    log.info("Safty property Falsified: Found CEX after %d steps", len(trace) - 1)
                     return False, trace
             else:
                 self.add_new_frame()
-                # Propagation stage
-                for index, frame in enumerate(self.frames[:-1]):
-                    invariant = self.checkForInduction(frame)
-                    if invariant is not None:
-                        print(f"Safty property Proven: get inductive invariant")
-                        return True, invariant
-                    literals = frame - self.frames[index + 1]
-                    s = Solver()
-                    s.add(And(frame.cube(), self.trans.cube()))
-                    for c in literals:
-                        s.push()
-                        # if (F[i] and T and Not(c)') == unsat, it means F[i] & T => c', c can be added to F[i+1]
-                        s.add(Not(substitute(c, self.primeMap)))
-                        if s.check() == unsat:
-                            self.frames[index + 1].addAnds([c])
-                        s.pop()
+                invariant = self.propagate()
+                if invariant is not None:
+                    log.info("Safty property Proven: get inductive invariant")
+                    return True, invariant
+                self.stats.inc("obligations_reopened", self.obligations.reopen(len(self.frames) - 1))
+                if self.lemma_out is not None:
+                    with self.stats.timer("invariant_export"):
+                        self.export_invariants()
 
-    # Checks whether the we have found an inductive invariant
-    def checkForInduction(self, frame):
-        check_frame = frame.cube()
-        s = Solver()
-        s.add(And(self.trans.cube(), check_frame, Not(substitute(check_frame, self.primeMap))))
-        if s.check() == unsat:
-            return check_frame
+    def propagate(self):
+        """
+        Push the lemmas of frames 1..n-2 one frame up where F_i & T keeps them, from the lowest
+        frame. A push that failed fails again as long as the solver of the frame has the same
+        clauses, so only lemmas that are new or whose frame learned something since they were tried
+        are checked and the cost of a propagation follows the lemmas learned since the last one.
+
+        :return: the inductive invariant when a delta frame becomes empty, else None
+        """
+        for index in range(1, len(self.frames) - 1):
+            slv = self.solvers[index]
+            for c in list(self.frames[index]):
+                # moved up or dropped by a lemma pushed before it
+                if self.level.get(c) != index:
+                    continue
+                if self.push_failed.get(c) == (index, slv.added):
+                    self.stats.inc("push_skipped")
+                    continue
+                # if (F[i] and T and c') == unsat, it means F[i] & T => Not(c)', Not(c) can be added to F[i+1]
+                with self.stats.timer("propagation"):
+                    pushed = not slv.check(self._assumptions(c, prime=True))
+                if pushed:
+                    self.add_lemma(c, index + 1)
+                else:
+                    self.push_failed[c] = (index, slv.added)
+            invariant = self.checkForInduction(index)
+            if invariant is not None:
+                return invariant
         return None
 
-    def recBlockCube(self, cube: tCube):
-        # print("recBlockCube now...")
-        Q = PriorityQueue()
-        Q.put((cube.t, cube))
-        while not Q.empty():
-            i, s = Q.get()
-            if i == 0:  # CEX found!
-                Q.put((i, s))
-                return get_trace_from_PQ(Q)
-            if self.check_from_current_frame(s) is None:
+    def export_invariants(self):
+        """
+        Put the lemmas of the last frame that are invariants to lemma_out. They are found as the
+        largest subset that is inductive together with the lemmas exported before (Houdini): a
+        lemma that some state of the subset leaves is dropped, until none is. Lemmas hold in the
+        initial states, so the subset is an invariant.
+        """
+        if self.inv_solver is None:
+            self.inv_solver = FrameSolver(self.enc, self.solver)
+        slv = self.inv_solver
+        active = [c for c in self.frames[-1] if c not in self.exported]
+        for c in active:
+            if c not in self.inv_act:
+                self.inv_act[c] = slv.new_var()
+                slv.add([-self.inv_act[c]] + [-self.cur_lits[l] for l in c.lits])
+        dropped = True
+        while dropped and active:
+            dropped = False
+            acts = [self.inv_act[a] for a in active]
+            for c in list(active):
+                if slv.check(acts + self._assumptions(c, prime=True)):
+                    active.remove(c)
+                    acts = [self.inv_act[a] for a in active]
+                    dropped = True
+        for c in active:
+            self.exported.add(c)
+            slv.add([-self.cur_lits[l] for l in c.lits])
+            self.lemma_out.put(tuple(l ^ 1 for l in c.lits))
+        self.stats.inc("lemmas_exported", len(active))
+
+    # Checks whether the we have found an inductive invariant
+    def checkForInduction(self, i):
+        # when the delta frame i is empty F[i] == F[i+1], so F[i] & T => F[i]'
+        if self.frames[i]:
+            return None
+        return [c for f in self.frames[i + 1 :] for c in f]
+
+    def recBlockCube(self):
+        """:return: the counterexample when an obligation of the queue cannot be blocked, else None"""
+        Q = self.obligations
+        while Q:
+            self.stats.gauge("obligation_queue", len(Q))
+            self.stats.tick()
+            ob = Q.pop()
+            self.stats.inc("obligations")
+            s = ob.cube
+            # an obligation holding an initial state reaches the bad states from there
+            if s.t == 0 or self.solvers[0].check(self._assumptions(s)):  # CEX found!
+                return self.trace(ob)
+            if not self.check_from_current_frame(s):
                 continue
-            # c = self.solveRelative(s)
-            c = self.check_from_last_frame(s)
+            c, core = self.solveRelative(s)
             if c is not None:
-                Q.put((s.t - 1, c))
-                Q.put((i, s))
+                Q.push(Obligation(c, self.model_inputs(self.solvers[s.t - 1]), ob))
+                Q.push(ob)
             else:
-                for i in range(1, s.t + 1):
-                    self.frames[i].addAnds([Not(s.cube())])
-                # only when s is not the last frame, this proof obligation is added
+                with self.stats.timer("generalization"):
+                    g = self.push_forward(self.MIC(core))
+                self.add_lemma(g, g.t)
+                # the obligation goes on in the next frame, blocked in the last one it waits for
+                # the next frame to be added
                 if s.t < len(self.frames) - 1:
-                    s_up = copy.deepcopy(s)
-                    s_up.t = s.t + 1
-                    Q.put((s_up.t, s_up))
+                    Q.push(Obligation(s.clone(s.t + 1), ob.inputs, ob.succ))
+                else:
+                    Q.park(ob)
         return None
 
     def check_from_current_frame(self, cube):
-        s = Solver()
         # Fi->!s
-        s.add(And(self.frames[cube.t].cube(), cube.cube()))
-        if s.check() == unsat:
-            return None
-        return s.model()
+        return self.solvers[cube.t].check(self._assumptions(cube))
+
+    def intersects_init(self, q: tCube):
+        # q holds an initial state unless one of its literals contradicts the initial value of a latch
+        return not any(l ^ 1 in self.init_set for l in q.lits)
 
-    def MIC(self, q: tCube):
-        # Generalization
-        for i in range(len(q.cubeLiterals)):
-            q1 = q.delete(i)
-            if self.down(q1):
+    def core_cube(self, q: tCube, core):
+        """
+        Literals of q whose primed copy is in the unsat core of a relative induction query on q.
+        Dropping the others keeps q inductive relative to the frame, but may bring back an initial
+        state, then a literal of q contradicting the initial states is put back.
+        """
+        core = set(core)
+        g = tCube(q.t, [l for l in q.lits if self.next_lits[l] in core])
+        if self.intersects_init(g):
+            for l in q.lits:
+                if l ^ 1 in self.init_set:
+                    return tCube(q.t, g.lits + (l,))
+            return q
+        return g
+
+    def MIC(self, q: tCube, depth=0):
+        # Generalization: drop literals one at a time while the cube stays inductive relative to
+        # F[q.t - 1], give up after mic_attempts failures in a row
+        attempts = self.mic_attempts
+        i = 0
+        while i < len(q) and attempts > 0:
+            q1 = self.down(q.delete(i), depth)
+            if q1 is not None:
                 q = q1
+            else:
+                attempts -= 1
+                i += 1
         return q
 
-    def down(self, q: tCube):
+    def down(self, q: tCube, depth=0):
+        ctgs = 0
         while True:
-            s = Solver()
             # check base case, q is candidate for generalized bad states, if I&q == sat, initial state contains q, which is not correct
-            s.push()
-            s.add(And(self.frames[0].cube(), q.cube()))
-            if s.check() == sat:
-                return False
-            s.pop()
-            # check consecution, F[i-1] & T => !q',
-            s.push()
-            s.add(
-                # And(self.frames[q.t].cube(), Not(q.cube()), self.trans.cube(), substitute(q.cube(), self.primeMap))
-                And(self.frames[q.t - 1].cube(), substitute(q.cube(), self.primeMap))
-            )
-            if unsat == s.check():
-                return True
-            # m = s.model()
-            # q.addModel(self.lMap, m)
-            # s.pop()
-            return False
+            if len(q) == 0 or self.intersects_init(q):
+                return None
+            # check consecution, F[i-1] & !q & T => !q',
+            c, core = self.solveRelative(q)
+            if c is None:
+                return core
+            # c is a counterexample to generalization (CTG), if it can be blocked one frame lower
+            # q may become inductive, otherwise q is joined with c
+            if depth < self.ctg_depth and ctgs < self.ctg_max and q.t > 1 and not self.intersects_init(c):
+                c_pred, c_core = self.solveRelative(c)
+                if c_pred is None:
+                    self.stats.inc("ctgs")
+                    ctgs += 1
+                    g = self.push_forward(self.MIC(c_core, depth + 1))
+                    self.add_lemma(g, g.t)
+                    continue
+            ctgs = 0
+            # keep the literals of q that c agrees with, c is not in q so at least one is dropped
+            c_lits = set(c.lits)
+            q = tCube(q.t, [l for l in q.lits if l in c_lits])
+
+    def push_forward(self, q: tCube):
+        # move a lemma up as long as it stays inductive relative to the frame below
+        while q.t < len(self.frames) - 1:
+            c, core = self.solveRelative(q.clone(q.t + 1))
+            if c is not None:
+                break
+            q = core
+        return q
 
     # tcube is bad state
     def solveRelative(self, cube):
-        s = Solver()
-        s.add(self.frames[cube.t - 1].cube())
-        s.add(self.trans.cube())
-        s.add(Not(cube.cube()))
-        s.add(substitute(cube.cube(), self.primeMap))  # F[i - 1] and T and Not(badCube) and badCube'
-        if s.check() == sat:
-            model = s.model()
-            c = tCube(cube.t - 1)
-            c.addModel(self.lMap, model)  # c = sat_model
-            return c
-        return None
-
-    def check_from_last_frame(self, cube):
-        s = Solver()
-        # check F[i-1]&T->!s' is valid, if not, return the predecessor
-        s.add(And(self.frames[cube.t - 1].cube(), self.trans.cube(), substitute(cube.cube(), self.primeMap)))
-        ## F[i-1]&T&!s->!s'
-        # s.add(And(self.frames[cube.t - 1].cube(), self.trans, Not(cube.cube()), substitute(cube.cube(), self.primeMap)))
-        if s.check() == sat:
-            model = s.model()
-            c = tCube(cube.t - 1)
-            c.addModel(self.lMap, model)
-            return c
-        return None
+        """
+        F[i - 1] and T and Not(badCube) and badCube'. Returns the predecessor cube at level i - 1
+        when the query is sat, else the cube reduced to the unsat core (see core_cube).
+        """
+        s = self.solvers[cube.t - 1]
+        with self.stats.timer("relative_induction"):
+            res = s.check_clauses([[-l for l in self._assumptions(cube)]], self._assumptions(cube, prime=True))
+        if res:
+            return self.cube_from_model(s, cube.t - 1, self.next_targets(cube)), None  # c = sat_model
+        return None, self.core_cube(cube, s.core())
 
-    def getBadCube(self, base):
-        s = Solver()
-        if base:
-            # if I&!p is sat, bad cube found
-            check_p = And(self.frames[-1].cube(), Not(self.post.cube()))
-        else:
-            # T&F&!p' is sat, bad cube found
-            check_p = And(self.trans.cube(), self.frames[-1].cube(), Not(substitute(self.post.cube(), self.primeMap)))
-        s.add(check_p)
-        if s.check() == sat:
-            res = tCube(len(self.frames) - 1)
-            res.addModel(self.lMap, s.model())
-            return res
+    def getBadCube(self):
+        # F&!p of the last frame is sat (I&!p before the first frame is added), a bad state of the
+        # last frame is found. Frames only hold blocked cubes, so the property is checked on the
+        # current state of the last frame.
+        s = self.solvers[-1]
+        with self.stats.timer("bad_cube"):
+            res = s.check([self.enc.bad_lit()])
+        if res:
+            return self.cube_from_model(s, len(self.frames) - 1, [self.enc.bad])
         return None
 
 
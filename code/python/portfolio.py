@@ -0,0 +1,113 @@
+"""
+Portfolio of model checking engines running in parallel on one model
+"""
+
+import logging
+import multiprocessing as mp
+import queue
+import subprocess
+import time
+from os import path as osp
+
+from aig import AIG
+from bmc import BMC
+from itp import ITP
+from pdr import PDR
+
+root = osp.abspath(osp.join(__file__, "../../../"))
+IC3REF = osp.join(root, "code/cpp/IC3ref/IC3")
+ENGINES = ("bmc", "kind", "pdr", "itp", "ic3ref")
+
+log = logging.getLogger(__name__)
+
+
+def _run_engine(name, aig, solver, k, results, lemmas):
+    if name == "pdr":
+        if lemmas is not None:
+            # kind may never read all the lemmas, the process must not wait for them to be flushed
+            # when it exits
+            lemmas.cancel_join_thread()
+        res = PDR(aig, solver, lemma_out=lemmas).run()
+    elif name == "kind":
+        res = BMC(aig, solver, lemma_in=lemmas).run(k_ind=True)
+    elif name == "itp":
+        res = ITP(aig, solver).run()
+    else:
+        res = BMC(aig, solver).run(k_ind=False, k=k)
+    # plain bmc gives up without an answer when the bound is reached
+    results.put((name, None if res is None else res[0]))
+
+
+def run_portfolio(aig: AIG, filename="", engines=("bmc", "kind", "pdr"), solver="minisat22", k=1000, timeout=None):
+    """
+    Start every engine in its own process (the python engines are forked from this one, so the
+    parsed graph is shared and not parsed again, IC3ref reads the file) and wait for the first
+    definitive answer, then kill the others. With both pdr and kind, the lemmas pdr proves to be
+    invariants are passed on to the step case of kind.
+
+    :param engines: names out of ENGINES, kind is k-induction
+    :param k: bound of the plain bmc engine
+    :param timeout: seconds before every engine is killed, None waits for ever
+    :return: (engine, proven) of the first answer, (None, None) when no engine gave one
+    """
+    ctx = mp.get_context("fork")
+    results = ctx.Queue()
+    procs, ic3ref = dict(), None
+    done = []  # processes that answered, joined with the others at the end
+    lemmas = ctx.Queue() if "pdr" in engines and "kind" in engines else None
+    for name in engines:
+        if name == "ic3ref":
+            if not filename:
+                log.warning("IC3ref needs the AIGER file of the model, skipped")
+                continue
+            with open(filename, "rb") as fp:
+                ic3ref = subprocess.Popen([IC3REF], stdin=fp, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        elif name in ENGINES:
+            p = ctx.Process(target=_run_engine, args=(name, aig, solver, k, results, lemmas), daemon=True)
+            p.start()
+            procs[name] = p
+        else:
+            log.error("Unknown engine %s, choose out of %s", name, ", ".join(ENGINES))
+            exit(1)
+
+    deadline = None if timeout is None else time.time() + timeout
+    winner = (None, None)
+    try:
+        while procs or ic3ref is not None:
+            try:
+                name, proven = results.get(timeout=0.05)
+                # the answer of an engine that exited with an error code after sending it still
+                # counts, its process was already dropped below
+                p = procs.pop(name, None)
+                if p is not None:
+                    done.append(p)
+                if proven is not None:
+                    winner = (name, proven)
+                    break
+            except queue.Empty:
+                pass
+            # an engine that died without an answer (crash, out of memory) is out of the race
+            for name, p in list(procs.items()):
+                if p.exitcode not in (None, 0):
+                    log.warning("%s exited with code %s", name, p.exitcode)
+                    del procs[name]
+            if ic3ref is not None and ic3ref.poll() is not None:
+                # IC3ref prints 0 for a safe and 1 for an unsafe model, as in the AIGER standard
+                out = ic3ref.stdout.read().split()
+                ic3ref = None
+                if out and out[-1] in (b"0", b"1"):
+                    winner = ("ic3ref", out[-1] == b"0")
+                    break
+            if deadline is not None and time.time() > deadline:
+                log.info("Portfolio timed out after %s seconds", timeout)
+                break
+    finally:
+        for p in list(procs.values()) + done:
+            p.kill()
+            p.join()
+        if ic3ref is not None:
+            ic3ref.kill()
+            ic3ref.wait()
+    if winner[0] is not None:
+        log.info("Portfolio: %s answered first, property %s", winner[0], "proven" if winner[1] else "falsified")
+    return winner
@@ -0,0 +1,47 @@
+"""
+Separate checking of the outputs of a multi-output AIG
+
+Every output (bad state property) is checked on its own slice of the graph, the cone of influence
+of that output and the constraints, so a property does not pay for logic that only the others
+depend on. Slices are checked one after another or by a pool of forked worker processes, and the
+results are handed out as they complete.
+"""
+
+import multiprocessing as mp
+
+from aig import AIG
+from bmc import BMC
+from pdr import PDR
+
+
+def slice_properties(aig: AIG):
+    """:return: a graph per output of aig, reduced to the cone of influence of that output"""
+    return [aig.coi([o]) for o in aig.outputs]
+
+
+def _check(task):
+    i, sliced, engine, solver, k, sim_budget = task
+    if engine == "pdr":
+        res = PDR(sliced, solver, sim_budget=sim_budget).run()
+    elif engine == "kind":
+        res = BMC(sliced, solver, sim_budget=sim_budget).run(k_ind=True)
+    else:
+        res = BMC(sliced, solver, sim_budget=sim_budget).run(k_ind=False, k=k)
+    return i, res
+
+
+def check_properties(slices, engine="pdr", solver="minisat22", jobs=1, k=1000, sim_budget=0.5):
+    """
+    :param slices: graphs of slice_properties
+    :param engine: pdr, kind (k-induction) or bmc (bounded to k steps)
+    :param jobs: worker processes, 1 checks the slices in this process
+    :return: generator of (output index, result of the engine run) in the order the checks finish
+    """
+    tasks = [(i, s, engine, solver, k, sim_budget) for i, s in enumerate(slices)]
+    if jobs <= 1 or len(tasks) <= 1:
+        for t in tasks:
+            yield _check(t)
+        return
+    with mp.get_context("fork").Pool(min(jobs, len(tasks))) as pool:
+        for r in pool.imap_unordered(_check, tasks):
+            yield r
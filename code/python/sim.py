@@ -0,0 +1,335 @@
+"""
+Simulation of And-Inverter Graphs
+"""
+
+import logging
+import time
+from heapq import heapify, heappush, heappop
+
+import numpy as np
+
+from aig import AIG, AND
+
+log = logging.getLogger(__name__)
+
+X = 2  # unknown value of ternary simulation
+ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+class TernarySim:
+    """
+    Ternary (0/1/X) simulation of one time frame of an AIG. It lifts a satisfying assignment of
+    the current state and inputs to a partial state: latches are set to X one at a time and the
+    X is kept when every target literal still evaluates to 1, so every state of the resulting cube
+    reaches the targets with the same inputs. A change only travels through the fan-outs of the
+    latch, in topological (variable) order, and is undone when a target becomes X.
+    """
+
+    def __init__(self, aig: AIG):
+        self.aig = aig
+        fanouts = [[] for _ in range(aig.num_vars)]
+        for v in range(1, aig.num_vars):
+            if aig.kind[v] == AND:
+                fanouts[aig.fanin0[v] >> 1].append(v)
+                fanouts[aig.fanin1[v] >> 1].append(v)
+        self.fanouts = fanouts
+        self.gates = [v for v in range(1, aig.num_vars) if aig.kind[v] == AND]
+        self.vals = bytearray(aig.num_vars)
+
+    def _and(self, v):
+        vals, aig = self.vals, self.aig
+        a, b = aig.fanin0[v], aig.fanin1[v]
+        va, vb = vals[a >> 1], vals[b >> 1]
+        if va != X:
+            va ^= a & 1
+        if vb != X:
+            vb ^= b & 1
+        if va == 0 or vb == 0:
+            return 0
+        if va == X or vb == X:
+            return X
+        return 1
+
+    def simulate(self, lits):
+        """binary simulation of the frame where the given input and latch literals are true"""
+        vals = self.vals = bytearray(self.aig.num_vars)
+        for l in lits:
+            vals[l >> 1] = (l & 1) ^ 1
+        for v in self.gates:
+            vals[v] = self._and(v)
+
+    def value(self, lit):
+        v = self.vals[lit >> 1]
+        return v if v == X else v ^ (lit & 1)
+
+    def _set_x(self, var, is_target):
+        # returns the (variable, old value) pairs changed and whether all targets stayed binary
+        vals, fanouts = self.vals, self.fanouts
+        undo = [(var, vals[var])]
+        vals[var] = X
+        heap = list(fanouts[var])
+        heapify(heap)
+        done = set()
+        while heap:
+            g = heappop(heap)
+            if g in done:
+                continue
+            done.add(g)
+            new = self._and(g)
+            if new != vals[g]:
+                undo.append((g, vals[g]))
+                vals[g] = new
+                if is_target[g]:
+                    return undo, False
+                for f in fanouts[g]:
+                    heappush(heap, f)
+        return undo, True
+
+    def lift(self, state, inputs, targets):
+        """
+        :param state: literals of the latches, a full assignment
+        :param inputs: literals of the inputs
+        :param targets: literals that are true under the assignment and have to stay true
+        :return: the literals of state that are needed
+        """
+        self.simulate(list(state) + list(inputs))
+        is_target = bytearray(self.aig.num_vars)
+        for l in targets:
+            is_target[l >> 1] = 1
+        kept = []
+        for l in state:
+            v = l >> 1
+            if is_target[v]:
+                kept.append(l)
+                continue
+            undo, ok = self._set_x(v, is_target)
+            if not ok:
+                for u, old in reversed(undo):
+                    self.vals[u] = old
+                kept.append(l)
+        return kept
+
+
+class BitSim:
+    """
+    Bit-parallel binary simulation: every variable holds a word of `width` bits, bit j being its
+    value in lane j, so one pass over the gates simulates `width` traces at once. Negation is an
+    xor with the all-ones word.
+    """
+
+    def __init__(self, aig: AIG, width=64):
+        self.aig = aig
+        self.width = width
+        self.mask = (1 << width) - 1
+        mask = self.mask
+        # gate, fan-in variables and the xor masks of their phases
+        self.gates = []
+        for v in range(1, aig.num_vars):
+            if aig.kind[v] == AND:
+                a, b = aig.fanin0[v], aig.fanin1[v]
+                self.gates.append((v, a >> 1, mask if a & 1 else 0, b >> 1, mask if b & 1 else 0))
+        self.vals = [0] * aig.num_vars
+
+    def simulate(self, state, inputs):
+        """
+        Evaluate one time frame.
+
+        :param state: a word per latch, in the order of aig.latches
+        :param inputs: a word per input, in the order of aig.inputs
+        :return: the words of the next state
+        """
+        vals, aig = self.vals, self.aig
+        for l, w in zip(aig.latches, state):
+            vals[l >> 1] = w
+        for l, w in zip(aig.inputs, inputs):
+            vals[l >> 1] = w
+        for v, a, na, b, nb in self.gates:
+            vals[v] = (vals[a] ^ na) & (vals[b] ^ nb)
+        return [self.word(n) for n in aig.nexts]
+
+    def word(self, lit):
+        return self.vals[lit >> 1] ^ (self.mask if lit & 1 else 0)
+
+    def replay(self, cexs):
+        """
+        Check traces, `width` of them per simulation pass. A trace is valid when its first state is
+        initial, the constraints hold in all of its frames and some output is true in its last one.
+
+        :param cexs: witness.Counterexample objects
+        :return: a bool per trace
+        """
+        res = []
+        for start in range(0, len(cexs), self.width):
+            res += self._replay(cexs[start : start + self.width])
+        return res
+
+    def _replay(self, cexs):
+        aig = self.aig
+        ok = 0
+        for j, cex in enumerate(cexs):
+            if all(init >= 2 or init == b for init, b in zip(aig.inits, cex.init)):
+                ok |= 1 << j
+        state = [sum(cex.init[i] << j for j, cex in enumerate(cexs)) for i in range(len(aig.latches))]
+        hit = 0
+        for f in range(max(len(cex) for cex in cexs)):
+            alive = ends = 0
+            inputs = [0] * len(aig.inputs)
+            for j, cex in enumerate(cexs):
+                if f < len(cex):
+                    alive |= 1 << j
+                    if f == len(cex) - 1:
+                        ends |= 1 << j
+                    for i, b in enumerate(cex.inputs[f]):
+                        inputs[i] |= b << j
+            nxt = self.simulate(state, inputs)
+            for c in aig.constraints:
+                ok &= self.word(c) | ~alive
+            bad = 0
+            for o in aig.outputs:
+                bad |= self.word(o)
+            hit |= bad & ends
+            state = nxt
+        ok &= hit
+        return [bool(ok >> j & 1) for j in range(len(cexs))]
+
+
+class RandomSim:
+    """
+    Random simulation of 64 * `words` traces at once, every variable holds a row of uint64 words.
+    Gates are grouped by topological level, a level is evaluated by one vectorized operation over
+    all of its gates, so the python work per frame grows with the depth of the graph and not with
+    its size. A trace whose constraints fail is dropped, a trace reaching a bad state is returned.
+    """
+
+    def __init__(self, aig: AIG, words=64, seed=0):
+        self.aig = aig
+        self.words = words
+        self.rng = np.random.default_rng(seed)
+        level = [0] * aig.num_vars
+        by_level = []
+        for v in range(1, aig.num_vars):
+            if aig.kind[v] == AND:
+                level[v] = 1 + max(level[aig.fanin0[v] >> 1], level[aig.fanin1[v] >> 1])
+                if level[v] > len(by_level):
+                    by_level.append([])
+                by_level[level[v] - 1].append(v)
+        # per level: gates, fan-in variables and the xor masks of the fan-in phases
+        self.levels = []
+        for gates in by_level:
+            f0 = np.array([aig.fanin0[v] for v in gates], dtype=np.int64)
+            f1 = np.array([aig.fanin1[v] for v in gates], dtype=np.int64)
+            self.levels.append((np.array(gates), f0 >> 1, self._masks(f0), f1 >> 1, self._masks(f1)))
+        self.input_vars = np.array([l >> 1 for l in aig.inputs], dtype=np.int64)
+        self.latch_vars = np.array([l >> 1 for l in aig.latches], dtype=np.int64)
+        self.nexts = self._lits(aig.nexts)
+        self.constraints = self._lits(aig.constraints)
+        self.outputs = self._lits(aig.outputs)
+        self.vals = np.zeros((aig.num_vars, words), dtype=np.uint64)
+
+    @staticmethod
+    def _masks(lits):
+        # all ones for negated literals, as a column that broadcasts over the words
+        return np.where(lits & 1, ONES, np.uint64(0))[:, None]
+
+    def _lits(self, lits):
+        lits = np.array(lits, dtype=np.int64)
+        return lits >> 1, self._masks(lits)
+
+    def _words(self, lits):
+        # rows of the literals, a pair of variables and masks from _lits
+        v, m = lits
+        return self.vals[v] ^ m
+
+    def _random(self, rows):
+        return self.rng.bit_generator.random_raw((rows, self.words)).astype(np.uint64)
+
+    def _init_state(self):
+        aig = self.aig
+        state = self._random(len(aig.latches))
+        for i, init in enumerate(aig.inits):
+            if init < 2:
+                state[i] = ONES if init else 0
+        return state
+
+    def _frame(self, state, inputs):
+        vals = self.vals
+        vals[self.latch_vars] = state
+        vals[self.input_vars] = inputs
+        for gates, a, na, b, nb in self.levels:
+            vals[gates] = (vals[a] ^ na) & (vals[b] ^ nb)
+
+    def run(self, depth=64, budget=1.0):
+        """
+        Simulate rounds of `depth` frames from random initial states (uninitialized latches) with
+        random inputs until `budget` seconds are spent.
+
+        :return: a witness.Counterexample of a trace reaching a bad state, None if none was hit
+        """
+        from witness import Counterexample
+
+        aig = self.aig
+        deadline = time.time() + budget
+        while time.time() < deadline:
+            init = state = self._init_state()
+            alive = np.full(self.words, ONES, dtype=np.uint64)
+            frames = []
+            for _ in range(depth):
+                inputs = self._random(len(aig.inputs))
+                frames.append(inputs)
+                self._frame(state, inputs)
+                if len(aig.constraints):
+                    alive &= np.bitwise_and.reduce(self._words(self.constraints), axis=0)
+                if len(aig.outputs):
+                    hit = np.bitwise_or.reduce(self._words(self.outputs), axis=0) & alive
+                    if hit.any():
+                        w = int(np.flatnonzero(hit)[0])
+                        bit = (int(hit[w]) & -int(hit[w])).bit_length() - 1
+
+                        def lane(rows):
+                            return [int(x) >> bit & 1 for x in rows[:, w]]
+
+                        return Counterexample(lane(init), [lane(f) for f in frames])
+                if not alive.any() or time.time() >= deadline:
+                    break
+                state = self._words(self.nexts)
+        return None
+
+    def signatures(self, variables, frames=32):
+        """
+        Signatures of variables over `frames` frames of random traces from the initial states, the
+        hash of their values in all traces and frames. Values are taken in the phase of the first
+        trace in the first frame, so variables equal up to complement get the same signature.
+
+        :param variables: array of AIG variables
+        :return: (signatures, phases) as arrays of uint64 and bool, one entry per variable
+        """
+        mult = self.rng.integers(1, 1 << 62, size=self.words, dtype=np.uint64) | np.uint64(1)
+        sig = np.zeros(len(variables), dtype=np.uint64)
+        phase = None
+        state = self._init_state()
+        for _ in range(frames):
+            self._frame(state, self._random(len(self.aig.inputs)))
+            rows = self.vals[variables]
+            if phase is None:
+                phase = (rows[:, 0] & np.uint64(1)).astype(bool)
+            rows = np.where(phase[:, None], rows ^ ONES, rows)
+            # a collision only costs whoever relies on the signatures a failed proof
+            sig = sig * np.uint64(0x9E3779B97F4A7C15) + (rows * mult).sum(axis=1, dtype=np.uint64)
+            state = self._words(self.nexts)
+        return sig, phase
+
+
+def random_cex(aig: AIG, budget, depth=64):
+    """
+    Random simulation pre-pass of the engines, looking for a shallow counterexample before their
+    first SAT query.
+
+    :param budget: seconds of simulation, 0 skips it
+    :return: a counterexample or None
+    """
+    if budget <= 0:
+        return None
+    cex = RandomSim(aig).run(depth, budget)
+    if cex is not None:
+        log.info("Safty property Falsified: random simulation found a CEX after %d steps", len(cex) - 1)
+    return cex
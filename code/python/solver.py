@@ -0,0 +1,185 @@
+"""
+Incremental SAT backends over DIMACS integer clauses
+"""
+
+import logging
+
+import z3
+
+log = logging.getLogger(__name__)
+
+# names accepted by pysat.solvers.Solver, plus the z3 wrapper below
+PYSAT_SOLVERS = (
+    "cadical103",
+    "cadical153",
+    "cadical195",
+    "glucose3",
+    "glucose4",
+    "glucose42",
+    "lingeling",
+    "maplechrono",
+    "maplecm",
+    "maplesat",
+    "mergesat3",
+    "minisat22",
+    "minisatgh",
+)
+SOLVERS = ("z3",) + PYSAT_SOLVERS
+
+
+class SatSolver:
+    """
+    Common interface of the backends: clauses are lists (or flat 0-terminated arrays) of non-zero
+    DIMACS literals, a query is a solve under assumption literals, after a satisfiable query the
+    model is read with value(), after an unsatisfiable one core() is the subset of the assumptions
+    used in the refutation. Both belong to the last solve and stay readable when clauses are added
+    after it.
+    """
+
+    def add_clause(self, clause):
+        raise NotImplementedError
+
+    def add_clauses(self, flat):
+        """add the clauses of a flat 0-terminated integer array"""
+        clause = []
+        for x in flat:
+            if x == 0:
+                self.add_clause(clause)
+                clause = []
+            else:
+                clause.append(x)
+
+    def solve(self, assumptions=()):
+        raise NotImplementedError
+
+    def value(self, lit: int):
+        raise NotImplementedError
+
+    def core(self):
+        raise NotImplementedError
+
+    def conflicts(self):
+        """conflicts of every query so far, 0 when the backend does not count them"""
+        return 0
+
+    def delete(self):
+        pass
+
+
+class Z3Terms:
+    """
+    Table of the z3 terms of DIMACS literals, x<v> and Not(x<v>), made once per variable and
+    shared by every z3 solver, so frames and unrollings that use the same variables do not build
+    and hash the same terms again.
+    """
+
+    def __init__(self):
+        self.pos = [None]
+        self.neg = [None]
+
+    def lit(self, l: int):
+        v = abs(l)
+        while len(self.pos) <= v:
+            x = z3.Bool(f"x{len(self.pos)}")
+            self.pos.append(x)
+            self.neg.append(z3.Not(x))
+        return self.pos[v] if l > 0 else self.neg[v]
+
+
+Z3_TERMS = Z3Terms()
+
+
+class Z3Solver(SatSolver):
+    """z3 used as a plain SAT solver, DIMACS variable v is the Boolean constant x<v>"""
+
+    def __init__(self):
+        self.slv = z3.Solver()
+        self.vars = Z3_TERMS.pos
+        self._lit = Z3_TERMS.lit
+        self.lit_of_id = dict()  # z3 term id of an assumption -> its DIMACS literal
+        self.model = None
+        self.values = None
+        self.last_core = []
+
+    def add_clause(self, clause):
+        self.slv.add(z3.Or([self._lit(l) for l in clause]))
+
+    def solve(self, assumptions=()):
+        terms, self.lit_of_id = [], dict()
+        for l in assumptions:
+            t = self._lit(l)
+            self.lit_of_id[t.get_id()] = l
+            terms.append(t)
+        res = self.slv.check(*terms) == z3.sat
+        # z3 forgets the model and the core as soon as something is asserted, so both are taken
+        # right away, model values are still read on demand since the model also holds every
+        # retired activation literal
+        if res:
+            self.model, self.values, self.last_core = self.slv.model(), dict(), []
+        else:
+            self.model, self.values = None, None
+            self.last_core = [self.lit_of_id[t.get_id()] for t in self.slv.unsat_core()]
+        return res
+
+    def value(self, lit: int):
+        v = abs(lit)
+        val = self.values.get(v)
+        if val is None:
+            val = v < len(self.vars) and z3.is_true(self.model.eval(self.vars[v], model_completion=True))
+            self.values[v] = val
+        return val if lit > 0 else not val
+
+    def core(self):
+        return self.last_core
+
+    def conflicts(self):
+        # the SAT core and the SMT core of z3 count conflicts under different keys
+        st = self.slv.statistics()
+        return sum(st.get_key_value(k) for k in st.keys() if k in ("conflicts", "sat conflicts"))
+
+
+class PysatSolver(SatSolver):
+    """one of the solvers bundled with python-sat (minisat, glucose, cadical, ...)"""
+
+    def __init__(self, name: str):
+        from pysat.solvers import Solver
+
+        self.slv = Solver(name=name)
+        self.model = []
+        self.last_core = []
+        # clauses go to the backend directly, the Solver wrapper only forwards them, which adds a
+        # python call per clause when frames of big designs are unrolled
+        self.add_clause = self.slv.solver.add_clause
+
+    def solve(self, assumptions=()):
+        res = self.slv.solve(assumptions=assumptions)
+        # taken right away like with z3, CaDiCaL refuses to give the core once a clause is added
+        if res:
+            self.model, self.last_core = self.slv.get_model(), []
+        else:
+            self.model, self.last_core = [], self.slv.get_core() or []
+        return res
+
+    def value(self, lit: int):
+        # variables the solver never saw are unconstrained, read them as false
+        v = abs(lit)
+        val = v <= len(self.model) and self.model[v - 1] > 0
+        return val if lit > 0 else not val
+
+    def core(self):
+        return self.last_core
+
+    def conflicts(self):
+        return self.slv.accum_stats().get("conflicts", 0)
+
+    def delete(self):
+        self.slv.delete()
+
+
+def make_solver(name="minisat22") -> SatSolver:
+    if name == "z3":
+        return Z3Solver()
+    if name in PYSAT_SOLVERS:
+        return PysatSolver(name)
+    log.error("Unknown SAT solver %s, choose one of %s", name, ", ".join(SOLVERS))
+    exit(1)
@@ -0,0 +1,111 @@
+"""
+Run statistics of the engines
+
+An engine keeps its statistics in a Stats object by name: counters, timers of one kind of query
+(calls and seconds), gauges that keep the last and the largest value of a quantity (the depth of
+the obligation queue) and values computed on demand when the statistics are written (lemmas per
+frame, solver conflicts). They are written as JSON when the run ends and, given an interval, every
+interval seconds while it runs, so a run that is killed still leaves them behind. The engines
+(bmc, pdr, itp) take a Stats object and write it when run() returns, whatever the outcome.
+"""
+
+import json
+import os
+import time
+
+
+class _Timer:
+    """context manager adding the calls and the seconds spent in them to one timer"""
+
+    __slots__ = ("calls", "seconds", "starts")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.starts = []
+
+    def __enter__(self):
+        self.starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        # nested uses of the same timer (recursive generalization) only count the outermost one
+        start = self.starts.pop()
+        if not self.starts:
+            self.calls += 1
+            self.seconds += time.perf_counter() - start
+        return False
+
+
+class Stats:
+    """counters, timers, gauges and computed values of one engine run, see the module doc"""
+
+    def __init__(self, path=None, interval=None):
+        """
+        :param path: JSON file the statistics are written to, None keeps them in memory only
+        :param interval: seconds between two writes of tick(), None only writes at the end of a run
+        """
+        self.path = path
+        self.interval = interval
+        self.start = time.time()
+        self.last_dump = self.start
+        self.counters = dict()
+        self.timers = dict()  # name -> _Timer
+        self.gauges = dict()  # name -> [last, max]
+        self.sources = dict()  # name -> function computing the value when the statistics are written
+
+    def inc(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def timer(self, name):
+        t = self.timers.get(name)
+        if t is None:
+            t = self.timers[name] = _Timer()
+        return t
+
+    def gauge(self, name, value):
+        g = self.gauges.get(name)
+        if g is None:
+            self.gauges[name] = [value, value]
+        else:
+            g[0] = value
+            if value > g[1]:
+                g[1] = value
+
+    def collect(self, name, fn):
+        """fn() is the value of name, computed every time the statistics are written"""
+        self.sources[name] = fn
+
+    def merge(self, snapshot):
+        """
+        take over the statistics of another run (a worker process) given by its as_dict(), they
+        replace the ones of the same names, so a later snapshot of the same run replaces an earlier
+        """
+        self.counters.update(snapshot["counters"])
+        for n, t in snapshot["timers"].items():
+            self.timer(n).calls, self.timer(n).seconds = t["calls"], t["seconds"]
+        self.gauges.update({n: [g["last"], g["max"]] for n, g in snapshot["gauges"].items()})
+        self.sources.update({n: (lambda v=v: v) for n, v in snapshot["values"].items()})
+
+    def as_dict(self):
+        return {
+            "elapsed": round(time.time() - self.start, 3),
+            "counters": dict(self.counters),
+            "timers": {n: {"calls": t.calls, "seconds": round(t.seconds, 6)} for n, t in self.timers.items()},
+            "gauges": {n: {"last": g[0], "max": g[1]} for n, g in self.gauges.items()},
+            "values": {n: fn() for n, fn in self.sources.items()},
+        }
+
+    def dump(self):
+        if self.path is None:
+            return
+        # written aside and renamed, a reader polling the file never sees half of it
+        with open(self.path + ".tmp", "w") as fp:
+            json.dump(self.as_dict(), fp, indent=1)
+        os.replace(self.path + ".tmp", self.path)
+        self.last_dump = time.time()
+
+    def tick(self):
+        """write the statistics when the interval has passed since the last write"""
+        if self.interval is not None and time.time() - self.last_dump >= self.interval:
+            self.dump()
@@ -0,0 +1,162 @@
+"""
+Sequential SAT sweeping: constant and equivalent latches and gates are merged before the engines
+run
+
+Random simulation from the initial states gives every latch and gate a signature, variables with
+the same signature up to complement (the constant included) are candidates for equivalence. The
+candidates are proven together by induction (van Eijk): they hold in the initial states and, when
+they all hold in a state, they hold in its successors. A failed check splits the classes by the
+values of its model and the check is repeated until it passes. Proven classes are merged into
+their first variable.
+
+Invariant constraints are only assumed in the state the step check starts from, so the classes hold
+in every step of a trace whose earlier steps satisfy the constraints, the step that violates one
+included. The constraint gates then keep their values wherever a trace is still valid and can be
+merged like any other gate.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+from aig import AIG, AND
+from cnf import AIGCNF
+from sim import RandomSim
+from solver import make_solver
+
+log = logging.getLogger(__name__)
+
+
+def signature_classes(aig: AIG, frames=32, words=16, seed=0):
+    """
+    :return: candidate classes, lists of (variable, phase) where variable ^ phase has the same
+        value in all simulated states, the first variable of a class is its smallest
+    """
+    # uninitialized latches start in any state, they (and the inputs) are never merged
+    init_of = {l >> 1: i for l, i in zip(aig.latches, aig.inits)}
+    cand = [0] + [v for v in range(1, aig.num_vars) if aig.kind[v] == AND or init_of.get(v, 2) < 2]
+    cand = np.array(cand, dtype=np.int64)
+    sig, phase = RandomSim(aig, words, seed).signatures(cand, frames)
+    classes = dict()
+    for v, s, p in zip(cand.tolist(), sig.tolist(), phase.tolist()):
+        classes.setdefault(s, []).append((v, int(p)))
+    return [c for c in classes.values() if len(c) > 1]
+
+
+class _Prover:
+    """one incremental solver over time frames 0 and 1 with miters between class members"""
+
+    def __init__(self, enc: AIGCNF, solver, init):
+        self.enc = enc
+        self.slv = make_solver(solver)
+        for f in (0, 1):
+            self.slv.add_clauses(enc.frame_clauses(f))
+        self.slv.add_clauses(enc.trans_template)
+        if init:
+            self.slv.add_clauses(enc.init_clauses())
+        else:
+            # the step starts from a valid step, not the one it checks (see the module doc)
+            for c in enc.constraint_lits(0):
+                self.slv.add_clause([c])
+        self.next_var = enc.num_vars(1) + 1
+        # (variable, representative literal) -> literal implying their equality in frame 0, and
+        # (variable, representative literal, frame) -> literal implying they differ in the frame
+        self.eq_lit = dict()
+        self.diff_lit = dict()
+
+    def new_var(self):
+        self.next_var += 1
+        return self.next_var - 1
+
+    def equal(self, v, r):
+        e = self.eq_lit.get((v, r))
+        if e is None:
+            e = self.eq_lit[(v, r)] = self.new_var()
+            table = self.enc.lit_table(0)
+            a, b = table[2 * v], table[r]
+            self.slv.add_clause([-e, -a, b])
+            self.slv.add_clause([-e, a, -b])
+        return e
+
+    def differ_lit(self, v, r, frame):
+        d = self.diff_lit.get((v, r, frame))
+        if d is None:
+            d = self.diff_lit[(v, r, frame)] = self.new_var()
+            table = self.enc.lit_table(frame)
+            a, b = table[2 * v], table[r]
+            self.slv.add_clause([-d, a, b])
+            self.slv.add_clause([-d, -a, -b])
+        return d
+
+    def differ(self, pairs, frame, assume_equal):
+        """
+        :return: whether some v and r of the (variable, representative literal) pairs can differ
+            in the frame, when assume_equal all of them are equal in frame 0
+        """
+        # the disjunction of the pairs of this round is guarded by a literal retired afterwards
+        act = self.new_var()
+        self.slv.add_clause([-act] + [self.differ_lit(v, r, frame) for v, r in pairs])
+        assumptions = [act] + ([self.equal(v, r) for v, r in pairs] if assume_equal else [])
+        res = self.slv.solve(assumptions)
+        self.slv.add_clause([-act])
+        return res
+
+    def value(self, v, frame):
+        return self.slv.value(self.enc.lit_table(frame)[2 * v])
+
+
+def _pairs(classes):
+    # every member but the first with the literal of the first in the phase of the member
+    pairs = []
+    for c in classes:
+        r, rp = c[0]
+        pairs += [(v, 2 * r + (p ^ rp)) for v, p in c[1:]]
+    return pairs
+
+
+def _split(classes, prover, frame):
+    # classes split by the values of the model, members keep their phase relative to each other
+    res = []
+    for c in classes:
+        parts = dict()
+        for v, p in c:
+            parts.setdefault(prover.value(v, frame) ^ p, []).append((v, p))
+        res += [part for part in parts.values() if len(part) > 1]
+    return res
+
+
+def prove_classes(aig: AIG, classes, solver="minisat22"):
+    """refine the candidate classes until they are an inductive invariant, see the module doc"""
+    enc = AIGCNF(aig)
+    base = _Prover(enc, solver, init=True)
+    while classes and base.differ(_pairs(classes), 0, False):
+        classes = _split(classes, base, 0)
+    step = _Prover(enc, solver, init=False)
+    # splitting keeps the base case, members of a part were all equal to the old representative
+    while classes and step.differ(_pairs(classes), 1, True):
+        classes = _split(classes, step, 1)
+    base.slv.delete()
+    step.slv.delete()
+    return classes
+
+
+def sweep(aig: AIG, solver="minisat22", frames=32, words=16, seed=0):
+    """
+    :return: the graph with proven constant and equivalent latches and gates merged and reduced
+        to the cone of influence
+    """
+    start = time.time()
+    classes = prove_classes(aig, signature_classes(aig, frames, words, seed), solver)
+    repl = dict(_pairs(classes))
+    res = aig.merge(repl).coi()
+    log.info(
+        "Sweeping merged %d latches and gates in %.2fs: latches %d -> %d, ands %d -> %d",
+        len(repl),
+        time.time() - start,
+        len(aig.latches),
+        len(res.latches),
+        aig.num_ands,
+        res.num_ands,
+    )
+    return res
@@ -1,8 +1,5 @@
-import re
 import inspect
-import tempfile
-from pathlib import Path
-import shutil, subprocess
+import io
 from z3 import *
 import sys
 from os import path as osp
@@ -12,21 +9,18 @@ root = osp.abspath(osp.join(__file__, "../../../"))
 sys.path.append(root)
 from pdr import PDR
 from bmc import BMC
-from model import tCube, Model
+from itp import ITP
+from model import Model
+from portfolio import run_portfolio
+from aig import AIG
+from witness import check_witnesses, read_witness, write_witness
+from stats import Stats
+from sweep import sweep
+from properties import check_properties, slice_properties
+from certificate import CertificateCache, check_certificate, clauses_from_lemmas, write_certificate
 from utils.formula import from_z3
 
 
-def convert_aig_to_aag(file, m):
-    aig_path = file
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        aigtoaig_cmd = f"{root}/code/aiger/aigtoaig"
-        tmpdir = Path(tmpdirname)
-        filepath = osp.join(tmpdir, "tmp.aag")
-        shutil.copy(aig_path, tmpdir)
-        subprocess.call([aigtoaig_cmd, aig_path, filepath])
-        return m.parse(filepath)
-
-
 def convert_z3_to_dimacs(z3_expr):  # z3_expr is a z3 expression, e.g. bmc.slv.assertions()
     f = from_z3(z3_expr)
     # cnf_string_lst = f.to_dimacs_string()
@@ -35,30 +29,105 @@ def convert_z3_to_dimacs(z3_expr):  # z3_expr is a z3 expression, e.g. bmc.slv.a
 
 
 def comp_circuits(args):
+    filepath = args.aag
     if args.mode == "ic3_ref":
         tool_cmd = f"{root}/code/cpp/IC3ref/IC3"
         full_cmd = f"{tool_cmd} -v < {filepath} 2>&1 | tee run.log"
         os.system(full_cmd)
         return
 
+    # both aag and aig are read natively
     m = Model()
-    filepath = args.aag
-    if filepath.endswith(".aig"):
-        inputs = convert_aig_to_aag(filepath, m)
-    else:
-        inputs = m.parse(filepath)
-
-    if args.mode in ["bmc"]:
-        slv = BMC(*inputs)
+    aig = model_aig = m.parse(filepath)
+    if args.sweep:
+        aig = sweep(aig, args.solver)
+
+    res = None
+    stats = Stats(args.stats, args.stats_interval)
+    if args.separate and args.mode in ["bmc", "pdr"]:
+        check_separately(aig, args)
+    elif args.mode in ["bmc"]:
+        slv = BMC(aig, args.solver, filepath, sim_budget=args.sim, stats=stats, simple_path=args.simple_path)
         # if args.mode == "bmc":
         #     print("Now running bmc")
         #     slv.run(k_ind=False, k=args.k)
         # elif args.mode == "k-ind":
         print("Now running k-induction")
-        slv.run()
+        res = slv.run(parallel=args.parallel)
+    elif args.mode == "itp":
+        slv = ITP(aig, args.solver, filepath, sim_budget=args.sim, stats=stats)
+        res = slv.run()
     elif args.mode == "pdr":
-        slv = PDR(*inputs)
-        slv.run()
+        cache = CertificateCache(args.cert_cache) if args.cert_cache else None
+        clauses = cache.get(model_aig, filepath, args.solver) if cache else None
+        if clauses is not None:
+            print(f"Safty property Proven: cached certificate of {len(clauses)} clauses checked")
+        else:
+            slv = PDR(aig, args.solver, filepath, sim_budget=args.sim, stats=stats)
+            res = slv.run()
+            if res[0]:
+                clauses = check_proof(aig, res[1], args.solver)
+                # written and cached for the graph of the file, checked on it and not on the graph
+                # PDR ran on (test_slv refuses -sweep with certificates)
+                if (cache or args.cert) and not check_certificate(model_aig, clauses, args.solver):
+                    raise ValueError(f"Invalid certificate: the invariant is not one of {filepath}")
+                if cache:
+                    cache.put(model_aig, filepath, clauses)
+        if clauses is not None and args.cert:
+            with open(args.cert, "w") as fp:
+                write_certificate(model_aig, clauses, fp, osp.basename(filepath))
+            print(f"Certificate written to {args.cert}")
+    elif args.mode == "portfolio":
+        run_portfolio(aig, filepath, args.engines.split(","), args.solver, args.k)
+    if res is not None and not res[0]:
+        check_cex(aig, res[1])
+        if args.witness:
+            with open(args.witness, "w") as fp:
+                write_witness(aig, res[1], fp)
+            print(f"Witness written to {args.witness}")
+
+
+def check_separately(aig, args):
+    # every output on its own slice, results are printed as the checks finish
+    slices = slice_properties(aig)
+    for i, s in enumerate(slices):
+        print(f"Property {i}: {s}")
+    engine = "pdr" if args.mode == "pdr" else "kind"
+    for i, res in check_properties(slices, engine, args.solver, args.jobs, args.k, args.sim):
+        if res is None:
+            print(f"Property {i}: unknown")
+        elif res[0]:
+            print(f"Property {i}: Safty property Proven")
+        else:
+            check_cex(slices[i], res[1])
+            print(f"Property {i}: Safty property Falsified after {len(res[1]) - 1} steps")
+            if args.witness:
+                with open(f"{args.witness}.{i}", "w") as fp:
+                    write_witness(slices[i], res[1], fp, props=[i])
+                print(f"Witness written to {args.witness}.{i}")
+
+
+def check_cex(aig, cex):
+    # a counterexample is replayed by simulation, it is not trusted because the engine found it
+    if not check_witnesses(aig, [cex])[0]:
+        raise ValueError(f"Invalid counterexample: {cex} does not reach a bad state")
+    # and written as a witness it reads back as the same trace
+    fp = io.StringIO()
+    write_witness(aig, cex, fp)
+    fp.seek(0)
+    back = read_witness(aig, fp)
+    if back is None or (back.init, back.inputs) != (list(cex.init), [list(i) for i in cex.inputs]):
+        raise ValueError(f"Invalid witness: {cex} reads back as {back}")
+    print(f"Counterexample of {len(cex) - 1} steps validated by simulation")
+
+
+def check_proof(aig, lemmas, solver="minisat22"):
+    # the invariant PDR converged to is checked on its own, like a counterexample
+    clauses = clauses_from_lemmas(lemmas)
+    if not check_certificate(aig, clauses, solver):
+        raise ValueError(f"Invalid proof: the {len(clauses)} clauses are not an inductive invariant")
+    print(f"Inductive invariant of {len(clauses)} clauses checked")
+    return clauses
 
 
 def generate_variables(N):
@@ -74,29 +143,20 @@ def print_and_write(file, string):
     print(string)
 
 
-def get_new_lits(tmp: tCube):
-    a = str(tmp.cube())
-    res = re.findall(pattern="k!\\d+", string=a)
-    if len(res) == 0:
-        return [], []
-    else:
-        res = list(set(res))
-        vars = [Bool(x) for x in res]
-        return vars, generate_prime(vars)
-
-
-def convert_to_tcube(formula):
-    tmp = tCube()
-    g = Goal()
-    g.add(formula)
-    t = Tactic("aig")  # 转化得到该公式的 aig
-    tmp.addAnds(t(g)[0])
-    v, vp = get_new_lits(tmp)
-    return tmp, v, vp
-
-
 def verify_program(
-    expected, title, variables, primes, init, trans, post, slv_name="bmc", show_result=False, show_trans=True
+    expected,
+    title,
+    variables,
+    primes,
+    init,
+    trans,
+    post,
+    slv_name="bmc",
+    solver="minisat22",
+    show_result=False,
+    show_trans=True,
+    simple_path=False,
+    parallel=False,
 ):
     fname = inspect.stack()[1][3]
 
@@ -109,22 +169,22 @@ def verify_program(
             print("Trans:", trans)
         print_and_write(f, "Post:" + str(post))
 
-        trans, new_lits, new_lits_p = convert_to_tcube(trans)
-        variables += new_lits
-        primes += new_lits_p
-        init, new_lits, new_lits_p = convert_to_tcube(init)
-        variables += new_lits
-        primes += new_lits_p
-
-        post, new_lits, new_lits_p = convert_to_tcube(post)
-        variables += new_lits
-        primes += new_lits_p
+        aig = Model().from_z3(variables, primes, init, trans, post)
 
         if slv_name == "pdr":
-            slv = PDR([], [], variables, primes, init, trans, post, "")
+            slv = PDR(aig, solver)
         elif slv_name == "bmc":
-            slv = BMC([], [], variables, primes, init, trans, post, "")
-        proven, output = slv.run()
+            slv = BMC(aig, solver, simple_path=simple_path)
+        elif slv_name == "itp":
+            slv = ITP(aig, solver)
+        if slv_name == "portfolio":
+            output, proven = run_portfolio(aig, solver=solver)
+        else:
+            proven, output = slv.run(parallel=parallel) if slv_name == "bmc" else slv.run()
+            if not proven:
+                check_cex(aig, output)
+            elif slv_name == "pdr":
+                check_proof(aig, output, solver)
         if proven == expected:
             print_and_write(f, f"Test passed on {fname}")
         else:
@@ -133,6 +193,77 @@ def verify_program(
         print(res_string + str(output) if show_result else res_string)
 
 
+def unreachable_loop(args):
+    x = Bool("x")
+    y = Bool("y")
+    variables = [x, y]
+    primes = [Bool(str(v) + "'") for v in variables]
+    # every state may stay, 10 may also move to 11, which is unreachable from 00
+    trans = Or(And(primes[0] == x, primes[1] == y), And(x, Not(y), primes[0], primes[1]))
+    verify_program(
+        True,
+        """SAFE
+The bad state 11 is entered from 10 after staying there any number of steps, so the property is
+not k-inductive for any k, on paths that visit a state once it is for k = 2""",
+        variables,
+        primes,
+        And(Not(x), Not(y)),
+        trans,
+        Not(And(x, y)),
+        slv_name=args.mode,
+        solver=args.solver,
+        # complete only on simple paths, plain k-induction never proves it
+        simple_path=True,
+        parallel=args.parallel,
+    )
+
+
+def input_only_sat(args):
+    """a bad output of two inputs and no latches, found in the base check, its witness has no initial values"""
+    aig = AIG()
+    aig.outputs.append(aig.add_and(aig.add_input(), aig.add_input()))
+    if args.mode == "portfolio":
+        _, proven = run_portfolio(aig, solver=args.solver)
+    else:
+        engine = {"pdr": PDR, "bmc": BMC, "itp": ITP}[args.mode]
+        # no random simulation, the engine has to find it
+        proven, cex = engine(aig, args.solver, sim_budget=0).run()
+        if not proven:
+            check_cex(aig, cex)
+            if len(cex) != 1:
+                raise ValueError(f"Test failed on input_only_sat: {cex} is not found in the base check")
+    if proven:
+        raise ValueError("Test failed on input_only_sat")
+    print("Test passed on input_only_sat")
+
+
+def constrained_sweep(args):
+    """
+    the bad output needs 24 inputs true in the initial state, too rare for random simulation to see,
+    the constraint forbids them only in the next state, so the swept model must still fail in step 0
+    """
+    aig = AIG()
+    rare = 1
+    for _ in range(24):
+        rare = aig.add_and(rare, aig.add_input())
+    first = aig.add_latch(1)
+    aig.set_next(0, 0)
+    seen = aig.add_latch(0)
+    aig.set_next(1, rare)
+    aig.constraints.append(seen ^ 1)
+    aig.outputs.append(aig.add_and(rare, first))
+    for g in (aig, sweep(aig, args.solver)):
+        if args.mode == "portfolio":
+            _, proven = run_portfolio(g, solver=args.solver)
+        else:
+            proven, cex = {"pdr": PDR, "bmc": BMC, "itp": ITP}[args.mode](g, args.solver).run()
+            if not proven:
+                check_cex(g, cex)
+        if proven:
+            raise ValueError(f"Test failed on constrained_sweep with {g}")
+    print("Test passed on constrained_sweep")
+
+
 def three_at_a_time(args):
     """
     :return: variables -> Boolean Variables, primes -> The Post Condition Variable, init -> The initial State,
@@ -174,6 +305,9 @@ which cannot be violated with a bit vector of size 8 and three bits flipped per
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -207,6 +341,9 @@ The post condition can now be violated flipping three bits at a time""",
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -235,6 +372,9 @@ which can take quite a while to fail depending on the width of the bitfield""",
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -275,6 +415,9 @@ AAAAA is not 11111, which is unsafe after 16 frames""",
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -318,6 +461,9 @@ so the postcondition is Not(overflow)""",
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -353,6 +499,9 @@ AAA is even, which is safe""",
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -381,6 +530,9 @@ which is inductive because one is initialized to true and never negated, only sw
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -413,6 +565,9 @@ which can be violated in 8 frames""",
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -431,6 +586,9 @@ def counter_unsat(args):
         Or(And(xp == x + 1, x < 64), xp == x),
         x < 10,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -450,6 +608,9 @@ def counter_sat(args):
         Or(And(xp == x + 1, x < 6), xp == x),
         x < 7,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -472,6 +633,9 @@ def add_sub_unsat(args):
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -494,6 +658,9 @@ def add_sub_sat(args):
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -513,6 +680,9 @@ def shifter_unsat(args):
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -532,6 +702,9 @@ def shifter_sat(args):
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -571,6 +744,9 @@ def lights_out_sat(args):
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
 
 
@@ -610,4 +786,7 @@ def lights_out_unsat(args):
         trans,
         post,
         slv_name=args.mode,
+        simple_path=args.simple_path,
+        parallel=args.parallel,
+        solver=args.solver,
     )
@@ -1,4 +1,5 @@
 import argparse
+import logging
 import sys
 import time
 from pyinstrument import Profiler
@@ -8,6 +9,8 @@ root = osp.abspath(osp.join(__file__, "../../../"))
 # print(f"project root: {root}")
 sys.path.append(root)
 from test_cases import *
+from solver import SOLVERS
+from portfolio import ENGINES
 
 
 def run_all(args):
@@ -29,6 +32,9 @@ tests = [
     one_at_a_time,
     three_at_a_time,
     three_at_a_time_odd,
+    unreachable_loop,
+    input_only_sat,
+    constrained_sweep,
     ### large_ones:
     # boolean_shifter,
     # boolean_incrementer,
@@ -54,10 +60,72 @@ def main():
     )
     parser.add_argument("-k", type=int, help="The number of unrolling steps", default=10, nargs="?")
     parser.add_argument(
-        "-mode", type=str, help="The mode of the algorithm, input bmc or k-ind", default="pdr", nargs="?"
+        "-mode",
+        type=str,
+        help="The mode of the algorithm: pdr, bmc (k-induction), itp (interpolation), ic3_ref or portfolio",
+        default="pdr",
+        nargs="?",
+    )
+    parser.add_argument(
+        "-engines",
+        type=str,
+        help=f"Comma separated engines of the portfolio mode, out of {','.join(ENGINES)}",
+        default="bmc,kind,pdr",
+        nargs="?",
+    )
+    parser.add_argument(
+        "-solver",
+        type=str,
+        help=f"SAT backend: {', '.join(SOLVERS)}",
+        default="minisat22",
+        choices=SOLVERS,
+        nargs="?",
+    )
+    parser.add_argument(
+        "-sim",
+        type=float,
+        help="seconds of random simulation before bmc, pdr or itp, 0 for none",
+        default=0.5,
+        nargs="?",
+    )
+    parser.add_argument(
+        "-separate", action="store_true", help="check every output on its own cone of influence (pdr, bmc modes)"
+    )
+    parser.add_argument("-jobs", type=int, help="worker processes of -separate", default=1, nargs="?")
+    parser.add_argument(
+        "-simple_path", action="store_true", help="complete k-induction on paths that visit a state once (bmc mode)"
+    )
+    parser.add_argument(
+        "-parallel", action="store_true", help="k-induction with the base and the step case in two processes (bmc mode)"
+    )
+    parser.add_argument(
+        "-sweep", action="store_true", help="merge latches and gates proven constant or equivalent before checking"
+    )
+    parser.add_argument(
+        "-witness", type=str, help="AIGER witness file written when comp_circuits finds a CEX", default=None, nargs="?"
+    )
+    parser.add_argument(
+        "-cert", type=str, help="certificate file written when pdr proves the property", default=None, nargs="?"
+    )
+    parser.add_argument(
+        "-cert_cache", type=str, help="directory of certificates reused across pdr runs", default=None, nargs="?"
+    )
+    parser.add_argument(
+        "-stats", type=str, help="JSON file of the statistics of the bmc, pdr or itp run", default=None, nargs="?"
+    )
+    parser.add_argument(
+        "-stats_interval", type=float, help="seconds between writes of -stats during the run", default=None, nargs="?"
+    )
+    parser.add_argument(
+        "-log", type=str, help="log level", default="info", choices=["debug", "info", "warning", "error"], nargs="?"
     )
     parser.add_argument("-testname", type=str, help="test name", default="comp_circuits", nargs="?")
     args = parser.parse_args()
+    if args.sweep and (args.cert or args.cert_cache):
+        # certificates are clauses over the latches of the file, the equivalences sweeping proved
+        # between gates can't be written in them
+        parser.error("-cert and -cert_cache can't be used with -sweep")
+    logging.basicConfig(level=args.log.upper(), format="%(message)s", stream=sys.stdout)
 
     test_lookup = {test.__name__: test for test in tests}
 
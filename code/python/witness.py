@@ -0,0 +1,101 @@
+"""
+Counterexample traces and the AIGER witness format
+
+A witness is a status line (1 for a failed property), the failed properties (b<index>), the
+initial latch values as one line of 0/1 characters, one line of input values per time frame and a
+terminating dot line. Values are given over the inputs and latches of the AIGER file, the trace of
+a graph reduced to a cone of influence is extended with 0 inputs and initial latch values.
+"""
+
+from aig import AIG
+from sim import BitSim
+
+
+class Counterexample:
+    """
+    A trace that ends in a bad state: the values of the latches in the first frame and of the
+    inputs in every frame, as lists of 0/1 in the order of aig.latches and aig.inputs.
+    """
+
+    __slots__ = ("init", "inputs")
+
+    def __init__(self, init, inputs):
+        self.init = init
+        self.inputs = inputs
+
+    def __len__(self):
+        # number of time frames, one more than the number of transitions
+        return len(self.inputs)
+
+    def __repr__(self):
+        return f"Counterexample({len(self) - 1} steps)"
+
+
+def _interface(aig: AIG):
+    """
+    :return: file position of each input and latch of the graph, number of file inputs, initial
+        values of the file latches (the graph itself when it was not read from a file)
+    """
+    if not aig.file_inputs and not aig.file_latches:
+        return list(range(len(aig.inputs))), list(range(len(aig.latches))), len(aig.inputs), list(aig.inits)
+    in_pos = {v: i for i, v in enumerate(aig.file_inputs)}
+    latch_pos = {v: i for i, v in enumerate(aig.file_latches)}
+    inputs = [in_pos[aig.origin[l >> 1]] for l in aig.inputs]
+    latches = [latch_pos[aig.origin[l >> 1]] for l in aig.latches]
+    return inputs, latches, len(aig.file_inputs), list(aig.file_inits)
+
+
+def failed_outputs(aig: AIG, cex: Counterexample):
+    """indices of the outputs that are true in the last frame of the trace"""
+    sim = BitSim(aig, 1)
+    state = cex.init
+    for inputs in cex.inputs:
+        state = sim.simulate(state, inputs)
+    return [i for i, o in enumerate(aig.outputs) if sim.word(o)]
+
+
+def write_witness(aig: AIG, cex: Counterexample, fp, props=None):
+    """
+    :param props: indices of the failed properties in the file, by default the outputs of the
+        graph that are true at the end of the trace
+    """
+    in_pos, latch_pos, n_inputs, file_inits = _interface(aig)
+    if props is None:
+        props = failed_outputs(aig, cex)
+    lines = ["1", " ".join(f"b{i}" for i in props)]
+    # latches outside the graph start in their initial value, 0 when uninitialized
+    init = [b if b < 2 else 0 for b in file_inits]
+    for p, b in zip(latch_pos, cex.init):
+        init[p] = b
+    lines.append("".join(map(str, init)))
+    for frame in cex.inputs:
+        values = [0] * n_inputs
+        for p, b in zip(in_pos, frame):
+            values[p] = b
+        lines.append("".join(map(str, values)))
+    lines.append(".")
+    fp.write("\n".join(lines) + "\n")
+
+
+def read_witness(aig: AIG, fp):
+    """
+    :return: the first trace of a witness file as a Counterexample of the graph, None when the
+        file reports no failed property. x values are read as 0.
+    """
+    in_pos, latch_pos, _, _ = _interface(aig)
+    # lines count by position, the initial values of a model without latches are an empty line
+    lines = [line.strip() for line in fp if not line.startswith("c")]
+    if not lines or lines[0] != "1":
+        return None
+    # lines[1] lists the failed properties, the frames end at the dot line
+    frames = lines[2 : lines.index(".")] if "." in lines else lines[2:]
+
+    def bits(line, positions):
+        return [1 if line[p] == "1" else 0 for p in positions]
+
+    return Counterexample(bits(frames[0], latch_pos), [bits(line, in_pos) for line in frames[1:]])
+
+
+def check_witnesses(aig: AIG, cexs, width=64):
+    """replay traces on the graph by bit-parallel simulation, a bool per trace telling whether it is valid"""
+    return BitSim(aig, width).replay(cexs)